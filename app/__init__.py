@@ -5,8 +5,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_babel import Babel, get_locale
 from flask_wtf.csrf import CSRFProtect
+from app.utils.replica import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 babel = Babel()
 csrf = CSRFProtect()
@@ -28,7 +29,15 @@ def create_app():
     app = Flask(__name__)
     app.config.from_object('config.Config')
 
+    # ! Database engine profiles, the options have to be set before the engines are created
+    from app.utils.engine import configure_engine_profiles, init_engine_profiles
+    configure_engine_profiles(app.config)
     db.init_app(app)
+    init_engine_profiles(app)
+    from app.utils.replica import init_replica
+    init_replica(app)
+    from app.utils.read_only import init_read_only_transactions
+    init_read_only_transactions(app)
     login_manager.init_app(app)
     babel.init_app(app, locale_selector=select_locale)
 
@@ -55,12 +64,22 @@ def create_app():
     app.register_blueprint(user_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(storage_bp)
-    
+
+    # ! Command registration
+    from app.commands import register_commands
+    register_commands(app)
+
+    # ! Lazy load check while rendering templates
+    from app.utils.loading import init_lazy_load_check
+    init_lazy_load_check(app)
+
     return app
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    """ Load a user from the database by the user id. """
+    """ Load a user from the database by the user id.
+    The user is read from the primary database, a deleted user must not stay logged in through a lagging replica.
+    """
     from app.user.model import User
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id), bind_arguments={'bind': db.engine})
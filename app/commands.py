@@ -0,0 +1,199 @@
+""" This module defines the command line commands of the application.
+    The commands are registered on the Flask application and can be run with
+    `flask --app main <group> <command>`.
+"""
+
+import click
+from flask import Flask
+from flask.cli import AppGroup
+
+
+stock_cli = AppGroup('stock', help='Maintain the stock of the items.')
+storage_cli = AppGroup('storage', help='Maintain the storage locations.')
+search_cli = AppGroup('search', help='Maintain the full-text search index.')
+images_cli = AppGroup('images', help='Maintain the stored image files.')
+items_cli = AppGroup('items', help='Import and export items.')
+schema_cli = AppGroup('schema', help='Migrate the database schema.')
+replica_cli = AppGroup('replica', help='Maintain the read replica of the database.')
+
+
+@stock_cli.command('backfill')
+def backfill_stock():
+    """ Fill the current stock snapshot of all items from the stock history again, the schema upgrade fills it once. """
+    from app.resource.item.model import backfill_current_stock
+    updated = backfill_current_stock()
+    click.echo(f'Updated the stock snapshot of {updated} items.')
+
+
+@stock_cli.command('compact')
+@click.option('--dry-run', is_flag=True, help='Only count the rows, do not archive them.')
+@click.option('--batch-size', default=1000, show_default=True, help='Maximum number of rows archived per transaction.')
+@click.option('--after-item', default=0, show_default=True, help='Continue an interrupted run after this item ID.')
+def compact_stock(dry_run, batch_size, after_item):
+    """ Reduce the old stock history to daily and weekly snapshots and archive the other rows. """
+    from flask import current_app
+    from app.resource.item.compaction import compact_stock_history
+    try:
+        archived = compact_stock_history(
+            raw_days=current_app.config.get('STOCK_HISTORY_RAW_DAYS', 90),
+            daily_days=current_app.config.get('STOCK_HISTORY_DAILY_DAYS', 365),
+            batch_size=batch_size,
+            after_item_id=after_item,
+            dry_run=dry_run,
+            progress=lambda item_id, count: click.echo(f'Processed items up to #{item_id}, {count} rows', err=True)
+        )
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo(f'{"Found" if dry_run else "Archived"} {archived} stock rows.')
+
+
+@storage_cli.command('rebuild-paths')
+def rebuild_paths():
+    """ Rebuild the materialized paths of all storage locations from their parents. """
+    from app import db
+    from app.resource.storage_location.storage import rebuild_storage_paths
+    count = rebuild_storage_paths()
+    db.session.commit()
+    click.echo(f'Rebuilt the paths of {count} storage locations.')
+
+
+@storage_cli.command('delete')
+@click.argument('storage_id', type=int)
+@click.option('--policy', type=click.Choice(['rehome', 'delete']), default='rehome', show_default=True,
+              help='Move the contained items to the parent storage location or delete them.')
+@click.option('--batch-size', default=500, show_default=True, help='Maximum number of IDs per statement.')
+def delete_storage(storage_id, policy, batch_size):
+    """ Delete a storage location with all storage locations inside it. """
+    from app.resource.storage_location.storage import delete_storage_subtree
+    with click.progressbar(length=0, label='Deleting') as bar:
+        def progress(done, total):
+            bar.length = total
+            bar.update(done - bar.pos)
+        try:
+            result = delete_storage_subtree(storage_id, policy, batch_size, progress=progress)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+    click.echo(f"Deleted {result['storages']} storage locations and {result['images']} image files, "
+               f"{'moved' if policy == 'rehome' else 'deleted'} {result['items']} items.")
+
+
+@search_cli.command('rebuild')
+def rebuild_search():
+    """ Create the full-text search index if required and rebuild it. """
+    from app import db
+    from app.resource.search.index import ensure_search_index, rebuild_search_index
+    if not ensure_search_index():
+        click.echo('The database does not support the full-text search index, LIKE is used instead.')
+        return
+    rebuild_search_index()
+    db.session.commit()
+    click.echo('Rebuilt the full-text search index.')
+
+
+@images_cli.command('migrate')
+def migrate_images():
+    """ Move images stored under a uuid name into the content-addressed image store. """
+    from app.utils.image_store import migrate_to_image_store
+    moved = migrate_to_image_store()
+    click.echo(f'Moved {moved} images into the image store.')
+
+
+@images_cli.command('gc')
+@click.option('--dry-run', is_flag=True, help='Only count the files, do not move or delete them.')
+@click.option('--batch-size', default=500, show_default=True, help='Number of files checked with one query.')
+def collect_image_garbage(dry_run, batch_size):
+    """ Quarantine image files which no row references and delete them after the grace period. """
+    from flask import current_app
+    from app.utils.image_store import IMAGE_KINDS, quarantine_orphan_images, purge_quarantined_images
+    min_age = current_app.config.get('IMAGE_GC_MIN_AGE', 3600)
+    grace_period = current_app.config.get('IMAGE_QUARANTINE_SECONDS', 7 * 24 * 3600)
+    for kind in IMAGE_KINDS:
+        deleted, restored = purge_quarantined_images(kind, grace_period, batch_size, dry_run)
+        quarantined = quarantine_orphan_images(kind, min_age, batch_size, dry_run)
+        click.echo(f'{kind}: quarantined {quarantined}, deleted {deleted}, restored {restored} images.')
+
+
+@items_cli.command('import')
+@click.argument('file', type=click.File('rb'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Format of the file, detected by the file extension by default.')
+@click.option('--batch-size', default=1000, show_default=True, help='Number of items per insert and transaction.')
+def import_items(file, fmt, batch_size):
+    """ Import items from a CSV or JSON Lines file, '-' reads from stdin. """
+    from app.resource.item.importer import import_items as run_import, detect_import_format
+    result = run_import(
+        file, fmt or detect_import_format(file.name), batch_size,
+        progress=lambda processed: click.echo(f'{processed} rows processed', err=True)
+    )
+    for line, message in result.errors:
+        click.echo(f'Line {line}: {message}', err=True)
+    click.echo(f'Imported {result.created} items, skipped {result.failed} rows.')
+
+
+@items_cli.command('export')
+@click.argument('file', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default='csv', show_default=True,
+              help='Format of the export.')
+@click.option('--batch-size', default=1000, show_default=True, help='Number of items fetched per partition.')
+def export_items(file, fmt, batch_size):
+    """ Export all items as CSV or JSON Lines, to stdout by default. """
+    from app.resource.item.exporter import iter_export
+    for chunk in iter_export(fmt, batch_size):
+        file.write(chunk)
+
+
+@schema_cli.command('upgrade')
+def upgrade_schema():
+    """ Create the missing tables and apply the pending migrations. """
+    from app.utils.schema import upgrade_schema as run_upgrade
+    try:
+        upgraded = run_upgrade()
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    for revision in upgraded:
+        click.echo(f'Applied {revision}')
+    click.echo(f'Applied {len(upgraded)} migrations.')
+
+
+@schema_cli.command('status')
+def schema_status():
+    """ Show the applied and the pending migrations. """
+    from app.utils.schema import MIGRATIONS, get_applied_migrations, get_foreign_key_violations
+    applied = set(get_applied_migrations())
+    for revision, _ in MIGRATIONS:
+        click.echo(f'{"applied" if revision in applied else "pending"}  {revision}')
+    for table, count in sorted(get_foreign_key_violations().items()):
+        click.echo(f'{count} rows of {table} violate foreign keys')
+
+
+@replica_cli.command('snapshot')
+def snapshot_replica():
+    """ Refresh the SQLite read replica with a snapshot of the database. """
+    from app import db
+    from app.utils.replica import REPLICA_BIND, snapshot_sqlite_database, sqlite_database_path
+    engine = db.engines.get(REPLICA_BIND)
+    if engine is None or engine.dialect.name != 'sqlite' or sqlite_database_path(engine.url) is None:
+        raise click.ClickException('DATABASE_REPLICA_URL is not set to a SQLite database file.')
+    try:
+        size = snapshot_sqlite_database(db.engine, sqlite_database_path(engine.url))
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo(f'Wrote a snapshot of {size} bytes to the replica.')
+
+
+def register_commands(app: Flask) -> None:
+    """ Register all command groups on the application.
+
+    Args:
+        app (Flask): The application to register the commands on.
+
+    Returns:
+        None
+    """
+    app.cli.add_command(stock_cli)
+    app.cli.add_command(storage_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(items_cli)
+    app.cli.add_command(schema_cli)
+    app.cli.add_command(replica_cli)
@@ -1,6 +1,7 @@
 """ Flask-WTF forms. """
 
-from typing import List
+from threading import Lock
+from typing import Dict, List, Tuple
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, FileField, MultipleFileField, \
@@ -10,7 +11,8 @@ from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, N
 from flask_babel import lazy_gettext as _l, gettext as _
 from app.user.model import User
 from app.resource.auth.model import Role, Permission
-from app.resource.category.model import Category, CategoryColor
+from app.resource.category.model import Category, CategoryColor, CATEGORY_VERSION
+from app.resource.data_version.model import get_data_version
 from app.resource.item.model import Item
 
 
@@ -61,27 +63,76 @@ class ItemCreateForm(FlaskForm):
     submit = SubmitField(_l('Create Item'))
 
 
-def build_item_form(
-        categories: List[Category],
-        users: List[User],
-        item: Item = None,
-        submit_text: str = _l('Submit')
-    ) -> FlaskForm:
-    """ Builds a dynamic form for item creation or update.
+class ItemImportForm(FlaskForm):
+    """Form for importing items from a CSV or JSON Lines file."""
+    file = FileField(_l('File'), validators=[DataRequired(), FileAllowed(['csv', 'jsonl', 'ndjson', 'json'])])
+    submit = SubmitField(_l('Import'))
+
+
+class ItemFormBase(FlaskForm):
+    """ Base class of the generated item forms.
 
-    This function creates a FlaskForm subclass with fields for item attributes,
-    including categories and users. It can be used for both creating a new item
-    and updating an existing one.
+    The fields are declared by the generated subclass, which is cached per set of categories.
+    The data of one request, the owner choices, the item and the label of the submit button,
+    is set per instance.
 
     Args:
-        categories (list): A list of Category objects to create category fields.
-        users (list): A list of User objects to populate the owner field.
+        categories (list): The Category objects of the category fields.
+        users (list): The users for the owner field, objects or rows with `id` and `username`.
         item (Item): An optional Item object to pre-fill the form for updates.
         submit_text (str): The text for the submit button.
+    """
+    def __init__(self, categories: List[Category], users: List[User], item: Item = None,
+                 submit_text: str = _l('Submit'), *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.submit.label.text = submit_text
+        self.owner.choices = [(0, _l('-- No Owner --'))] + [(user.id, user.username) for user in users]
+
+        if item:
+            self.id.data = item.id
+            self.name.data = item.name
+            self.description.data = item.description
+            self.storage_location.data = item.storage_location_id
+            current_stock = item.get_current_stock()
+            self.quantity.data = current_stock if current_stock is not None else 1
+            self.owner.data = item.owner_id or 0
+            # Category marked as checked if item has it
+            item_category_ids = {category.id for category in item.categories} if hasattr(item, "categories") else None
+            if item_category_ids is not None:
+                for category in categories:
+                    getattr(self, f'category_{category.id}').data = category.id in item_category_ids
+        elif not self.is_submitted():
+            # a new form starts empty, a submitted form keeps the posted owner and categories
+            for category in categories:
+                field_name = f'category_{category.id}'
+                if hasattr(self, field_name):
+                    getattr(self, field_name).data = False
+            self.owner.data = 0
+
+
+# The generated form classes by the IDs of their categories, with the category version they were built for
+_item_form_classes: Dict[Tuple[int, ...], Tuple[int, type]] = {}
+_item_form_classes_lock = Lock()
+
+
+def get_item_form_class(categories: List[Category]) -> type:
+    """ Get the form class with the item fields and one field per category.
+    Building a form class is expensive, the classes are cached per set of categories
+    until the category version changes, i.e. a category is created, renamed or deleted.
+
+    Args:
+        categories (list): The Category objects of the category fields.
 
     Returns:
-        FlaskForm: A dynamically created form class with fields for item attributes.
+        type: A subclass of `ItemFormBase`.
     """
+    category_ids = tuple(category.id for category in categories)
+    # without categories the fields never change
+    version = get_data_version(CATEGORY_VERSION) if category_ids else 0
+    with _item_form_classes_lock:
+        cached = _item_form_classes.get(category_ids)
+    if cached and cached[0] == version:
+        return cached[1]
 
     fields: dict = {
         'id': HiddenField(_l('Item ID'), validators=[Optional()]),
@@ -91,54 +142,42 @@ def build_item_form(
         'owner': SelectField(_l('Owner'), choices=[], coerce=int, validators=[Optional()]),
         'storage_location': StringField(_l('Storage Location'), validators=[Optional()]),
         'quantity': IntegerField(_l('Quantity'), default=1, validators=[Optional(), NumberRange(min=0, message=_l('Quantity must be at least 0'))]),
-        'submit': SubmitField(submit_text)
+        'submit': SubmitField(_l('Submit'))
     }
     for category in categories:
         fields[f'category_{category.id}'] = BooleanField(category.name, default=False)
+    form_class = type('DynamicItemUpdateForm', (ItemFormBase,), fields)
 
-    DynamicItemUpdateForm = type('DynamicItemUpdateForm', (FlaskForm,), fields)
+    with _item_form_classes_lock:
+        if any(cached_version != version for cached_version, _ in _item_form_classes.values()):
+            _item_form_classes.clear()
+        _item_form_classes[category_ids] = (version, form_class)
+    return form_class
 
-    class _Form(DynamicItemUpdateForm):
-        """ Dynamically generated form for item creation or update.
 
-        This form contains fields for item attributes, including categories and users(owner selection).
-        It can be used for both creating a new item and updating an existing one.
+def build_item_form(
+        categories: List[Category],
+        users: List[User],
+        item: Item = None,
+        submit_text: str = _l('Submit')
+    ) -> FlaskForm:
+    """ Builds a dynamic form for item creation or update.
 
-        Args:
-            categories (list): A list of Category objects to create category fields.
-            users (list): A list of User objects to populate the owner field.
-            item (Item): An optional Item object to pre-fill the form for updates.
-            submit_text (str): The text for the submit button.
-        """
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-            owner_choices = [(0, _l('-- No Owner --'))] + [(user.id, user.username) for user in users]
-            self.owner.choices = owner_choices
-
-            if item:
-                self.id.data = item.id
-                self.name.data = item.name
-                self.description.data = item.description
-                self.storage_location.data = item.storage_location_id
-                self.quantity.data = item.get_current_stock() if item.get_current_stock() is not None else 1
-                self.owner.data = item.owner.id if item.owner else 0
-                # Category marked as checked if item has it
-                if hasattr(item, "categories"):
-                    for category in categories:
-                        field_name = f'category_{category.id}'
-                        if category in item.categories:
-                            getattr(self, field_name).data = True
-                        else:
-                            getattr(self, field_name).data = False
-
-            else:
-                for category in categories:
-                    field_name = f'category_{category.id}'
-                    if hasattr(self, field_name):
-                        getattr(self, field_name).data = False
-                self.owner.data = 0
+    The form class with fields for the item attributes and the categories is cached,
+    see `get_item_form_class`, only the form instance is created per call.
+    It can be used for both creating a new item and updating an existing one.
 
-    return _Form()
+    Args:
+        categories (list): A list of Category objects to create category fields.
+        users (list): The users for the owner field, objects or rows with `id` and `username`.
+        item (Item): An optional Item object to pre-fill the form for updates.
+        submit_text (str): The text for the submit button.
+
+    Returns:
+        FlaskForm: An instance of the form class with fields for item attributes.
+    """
+    form_class = get_item_form_class(categories)
+    return form_class(categories, users, item=item, submit_text=submit_text)
 
 
 class ItemUpdateForm(FlaskForm):
@@ -58,7 +58,9 @@ class Role(db.Model):
         Returns:
             None
         """
+        from app.resource.auth.permission import invalidate_permissions
         self.permissions.append(permission)
+        invalidate_permissions()
         db.session.commit()
 
     def remove_permission(self, permission: Permission) -> None:
@@ -70,7 +72,9 @@ class Role(db.Model):
         Returns:
             None
         """
+        from app.resource.auth.permission import invalidate_permissions
         self.permissions.remove(permission)
+        invalidate_permissions()
         db.session.commit()
 
     def has_permission(self, permission_name: str) -> bool:
@@ -136,7 +140,9 @@ class Group(db.Model):
             None    
         """
         if not self.has_role(role.name):
+            from app.resource.auth.permission import invalidate_permissions
             self.roles.append(role)
+            invalidate_permissions()
             db.session.commit()
 
     def remove_role(self, role: Role) -> None:
@@ -150,7 +156,9 @@ class Group(db.Model):
             None
         """
         if self.has_role(role.name):
+            from app.resource.auth.permission import invalidate_permissions
             self.roles.remove(role)
+            invalidate_permissions()
             db.session.commit()
     
 
@@ -198,5 +206,7 @@ class Group(db.Model):
         This method removes the group from the database and commits the changes.
         It does not check for any dependencies or associations before deletion, so use with caution.
         """
+        from app.resource.auth.permission import invalidate_permissions
         db.session.delete(self)
+        invalidate_permissions()
         db.session.commit()
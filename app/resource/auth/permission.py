@@ -0,0 +1,82 @@
+""" Permission Resolution
+    This module resolves the effective permissions of users.
+    The permissions of a user are flattened into a frozenset once and cached per request and per process.
+    The process cache is invalidated through the 'permission' data version, which has to be bumped
+    whenever roles, groups, their permissions or their members change.
+    The permissions and their version are read from the primary database, a read replica may lag behind
+    and would keep revoked permissions alive.
+"""
+
+from threading import Lock
+from typing import Dict, FrozenSet, Tuple
+from flask import g
+from app import db
+from app.resource.auth.model import Permission, role_permission, group_role, group_user
+from app.resource.data_version.model import get_data_version, bump_data_version
+
+
+PERMISSION_VERSION = 'permission'
+
+_permission_cache: Dict[int, Tuple[int, FrozenSet[str]]] = {}
+_permission_cache_lock = Lock()
+
+
+def load_user_permissions(user_id: int) -> FrozenSet[str]:
+    """ Load the names of all permissions a user has through its groups and their roles.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        FrozenSet[str]: The names of the permissions of the user.
+    """
+    names = db.session.execute(
+        db.select(Permission.name)
+        .join(role_permission, role_permission.c.permission_id == Permission.id)
+        .join(group_role, group_role.c.role_id == role_permission.c.role_id)
+        .join(group_user, group_user.c.group_id == group_role.c.group_id)
+        .where(group_user.c.user_id == user_id)
+        .distinct(),
+        bind_arguments={'bind': db.engine}
+    ).scalars()
+    return frozenset(names)
+
+
+def get_user_permissions(user_id: int) -> FrozenSet[str]:
+    """ Get the names of all permissions of a user from the cache.
+    Within a request the permissions are resolved once. Across requests they are reused
+    as long as the permission version has not changed.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        FrozenSet[str]: The names of the permissions of the user.
+    """
+    request_cache = g.setdefault('user_permissions', {})
+    if user_id in request_cache:
+        return request_cache[user_id]
+
+    version = get_data_version(PERMISSION_VERSION, bind=db.engine)
+    with _permission_cache_lock:
+        cached = _permission_cache.get(user_id)
+    if cached and cached[0] == version:
+        permissions = cached[1]
+    else:
+        permissions = load_user_permissions(user_id)
+        with _permission_cache_lock:
+            _permission_cache[user_id] = (version, permissions)
+
+    request_cache[user_id] = permissions
+    return permissions
+
+
+def invalidate_permissions() -> None:
+    """ Invalidate the cached permissions of all users.
+    The new permission version is part of the current transaction and takes effect with its commit.
+
+    Returns:
+        None
+    """
+    bump_data_version(PERMISSION_VERSION)
+    g.pop('user_permissions', None)
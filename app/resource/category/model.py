@@ -1,10 +1,16 @@
 """ This module defines the Category model for the application. """
 
+from sqlalchemy import event
 from app import db
+from app.resource.data_version.model import bump_data_version
 from app.resource.item.model import Item
 from app.resource.storage_location.model import StorageLocation
 
 
+# Name of the data version which changes with the set of categories and their names
+CATEGORY_VERSION = 'category'
+
+
 item_category = db.Table(
     'item_category',
     db.Column('item_id', db.Integer, db.ForeignKey('item.id'), primary_key=True),
@@ -39,6 +45,29 @@ class Category(db.Model):
         return f"<Category #{self.id} {self.name}>"
 
 
+@event.listens_for(db.session, 'before_flush')
+def bump_category_version(session, flush_context, instances) -> None:
+    """ Bump the category version when categories are created, renamed or deleted.
+    The new version is written in the same transaction as the changes.
+
+    Args:
+        session (Session): The session which is flushed.
+        flush_context (UOWTransaction): The internal flush context.
+        instances (list): Deprecated argument, always None.
+
+    Returns:
+        None
+    """
+    for obj in session.new | session.deleted:
+        if isinstance(obj, Category):
+            bump_data_version(CATEGORY_VERSION, session)
+            return
+    for obj in session.dirty:
+        if isinstance(obj, Category) and db.inspect(obj).attrs.name.history.has_changes():
+            bump_data_version(CATEGORY_VERSION, session)
+            return
+
+
 class CategoryColor(db.Model):
     """Color model for categories.
     
@@ -0,0 +1,173 @@
+""" Aggregated statistics of the dashboard.
+    Every statistic is computed with a single grouped query and the results are cached in the process.
+    The cache is invalidated by the inventory version, which is bumped whenever items, stock, storage locations,
+    categories or users change, and expires after `DASHBOARD_CACHE_SECONDS` in any case.
+"""
+
+import time
+from datetime import date, datetime, timedelta, timezone
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from flask import current_app
+from sqlalchemy import event
+from app import db
+from app.resource.category.model import Category, item_category
+from app.resource.data_version.model import get_data_version, bump_data_version
+from app.resource.item.model import Item, ItemStorageStock
+from app.resource.storage_location.model import StorageLocation
+from app.resource.storage_location.tree import get_storage_tree
+from app.user.model import User
+
+
+INVENTORY_VERSION = 'inventory'
+
+_statistics_cache: Dict[str, Tuple[int, float, dict]] = {}
+_statistics_cache_lock = Lock()
+
+
+def count_overall() -> List[int]:
+    """ Count the users, storage locations and items with one query.
+
+    Returns:
+        list: The numbers of users, storage locations and items.
+    """
+    row = db.session.execute(db.select(
+        db.select(db.func.count()).select_from(User).scalar_subquery(),
+        db.select(db.func.count()).select_from(StorageLocation).scalar_subquery(),
+        db.select(db.func.count()).select_from(Item).scalar_subquery(),
+    )).one()
+    return list(row)
+
+
+def count_items_per_root_storage() -> Tuple[List[Optional[str]], List[int]]:
+    """ Count the items per root storage location.
+    The items are counted per storage location and summed up to the roots with the storage tree.
+
+    Returns:
+        tuple: The names of the root storage locations, None for items without storage location,
+            and the numbers of items, sorted by the number of items.
+    """
+    tree = get_storage_tree()
+    counts: Dict[Optional[int], int] = {}
+    rows = db.session.execute(
+        db.select(Item.storage_location_id, db.func.count(Item.id))
+        .group_by(Item.storage_location_id)
+    )
+    for storage_id, count in rows:
+        root = tree.get_root(storage_id)
+        root_id = root.id if root is not None else None
+        counts[root_id] = counts.get(root_id, 0) + count
+
+    ordered = sorted(counts.items(), key=lambda entry: entry[1], reverse=True)
+    labels = [tree.get(root_id).name if root_id is not None else None for root_id, _ in ordered]
+    return labels, [count for _, count in ordered]
+
+
+def sum_quantity_per_category() -> Tuple[List[str], List[int]]:
+    """ Sum the current quantity of the items per category.
+
+    Returns:
+        tuple: The names of the categories and the quantities, sorted by the quantity.
+    """
+    quantity = db.func.coalesce(db.func.sum(Item.current_quantity), 0)
+    rows = db.session.execute(
+        db.select(Category.name, quantity)
+        .join(item_category, item_category.c.category_id == Category.id)
+        .join(Item, Item.id == item_category.c.item_id)
+        .group_by(Category.id, Category.name)
+        .order_by(quantity.desc())
+    ).all()
+    return [name for name, _ in rows], [int(total) for _, total in rows]
+
+
+def count_stock_changes_per_week(weeks: int) -> Tuple[List[str], List[int]]:
+    """ Count the stock changes per week of the last weeks.
+    The changes are grouped by day in the database, which works on every database,
+    and the at most `7 * weeks` days are summed up to weeks starting on Monday.
+
+    Args:
+        weeks (int): The number of weeks, including the current week.
+
+    Returns:
+        tuple: The first days of the weeks in ISO format and the numbers of changes.
+    """
+    today = datetime.now(timezone.utc).date()
+    first_week = today - timedelta(days=today.weekday(), weeks=weeks - 1)
+    counts = {first_week + timedelta(weeks=week): 0 for week in range(weeks)}
+
+    day = db.func.date(ItemStorageStock.timestamp)
+    rows = db.session.execute(
+        db.select(day, db.func.count(ItemStorageStock.id))
+        .where(ItemStorageStock.timestamp >= datetime.combine(first_week, datetime.min.time()))
+        .group_by(day)
+    )
+    for changed, count in rows:
+        if not isinstance(changed, date):
+            changed = date.fromisoformat(str(changed)[:10])
+        week = changed - timedelta(days=changed.weekday())
+        if week in counts:
+            counts[week] += count
+    return [week.isoformat() for week in counts], list(counts.values())
+
+
+def load_dashboard_statistics() -> dict:
+    """ Compute all statistics of the dashboard.
+
+    Returns:
+        dict: The labels and values of every statistic by its name.
+    """
+    storage_labels, storage_counts = count_items_per_root_storage()
+    category_labels, category_quantities = sum_quantity_per_category()
+    week_labels, week_counts = count_stock_changes_per_week(current_app.config.get('DASHBOARD_WEEKS', 12))
+    return {
+        'overall_sum': {'labels': None, 'data': count_overall()},
+        'items_per_storage': {'labels': storage_labels, 'data': storage_counts},
+        'quantity_per_category': {'labels': category_labels, 'data': category_quantities},
+        'stock_changes_per_week': {'labels': week_labels, 'data': week_counts},
+    }
+
+
+def get_dashboard_statistics() -> dict:
+    """ Get the statistics of the dashboard from the cache.
+    They are reused as long as the inventory version has not changed
+    and they are not older than `DASHBOARD_CACHE_SECONDS`.
+    The statistics are shared, so they must not be modified.
+
+    Returns:
+        dict: The labels and values of every statistic by its name.
+    """
+    version = get_data_version(INVENTORY_VERSION)
+    max_age = current_app.config.get('DASHBOARD_CACHE_SECONDS', 300)
+    with _statistics_cache_lock:
+        cached = _statistics_cache.get('dashboard')
+    if cached and cached[0] == version and time.monotonic() - cached[1] < max_age:
+        return cached[2]
+
+    statistics = load_dashboard_statistics()
+    with _statistics_cache_lock:
+        _statistics_cache['dashboard'] = (version, time.monotonic(), statistics)
+    return statistics
+
+
+@event.listens_for(db.session, 'before_flush')
+def bump_inventory_version(session, flush_context, instances) -> None:
+    """ Bump the inventory version when the data of the dashboard changes.
+    The new version is written in the same transaction as the changes.
+    Bulk changes which bypass the session have to bump the version themselves.
+
+    Args:
+        session (Session): The session which is flushed.
+        flush_context (UOWTransaction): The internal flush context.
+        instances (list): Deprecated argument, always None.
+
+    Returns:
+        None
+    """
+    for obj in session.new | session.deleted:
+        if isinstance(obj, (Item, ItemStorageStock, StorageLocation, Category, User)):
+            bump_data_version(INVENTORY_VERSION, session)
+            return
+    for obj in session.dirty:
+        if isinstance(obj, (Item, StorageLocation, Category)) and session.is_modified(obj):
+            bump_data_version(INVENTORY_VERSION, session)
+            return
@@ -0,0 +1,67 @@
+""" This module defines the DataVersion model for the database.
+    A data version is a named counter which is increased whenever the data it stands for changes.
+    It is used to invalidate caches, also across multiple processes.
+"""
+
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+
+class DataVersion(db.Model):
+    """ Represents the version of a set of data.
+
+    Attributes:
+        name (str): Unique name of the set of data, e.g. 'permission'.
+        version (int): The current version, increased on every change.
+    """
+    __tablename__ = 'data_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DataVersion {self.name} v{self.version}>"
+
+
+def get_data_version(name: str, bind=None) -> int:
+    """ Returns the current version of a set of data.
+
+    Args:
+        name (str): The name of the set of data.
+        bind (Engine): The engine to read from, e.g. the primary database. Defaults to the engine of the session.
+
+    Returns:
+        int: The current version, 0 if the data has never changed.
+    """
+    version = db.session.execute(
+        db.select(DataVersion.version).where(DataVersion.name == name),
+        bind_arguments={'bind': bind} if bind is not None else None
+    ).scalar()
+    return version or 0
+
+
+def bump_data_version(name: str, session=None) -> None:
+    """ Increases the version of a set of data.
+    The change is part of the current transaction and becomes visible with its commit.
+    The rows of the known sets of data are created by a migration. A missing row is inserted in a savepoint,
+    if a concurrent transaction inserted it first, its version is increased instead.
+
+    Args:
+        name (str): The name of the set of data.
+        session (Session): The session or connection to use, e.g. within session events. Defaults to `db.session`.
+
+    Returns:
+        None
+    """
+    session = session or db.session
+    update = (
+        db.update(DataVersion)
+        .where(DataVersion.name == name)
+        .values(version=DataVersion.version + 1)
+    )
+    if session.execute(update).rowcount > 0:
+        return
+    try:
+        with session.begin_nested():
+            session.execute(db.insert(DataVersion).values(name=name, version=1))
+    except IntegrityError:
+        session.execute(update)
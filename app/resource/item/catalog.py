@@ -0,0 +1,137 @@
+"""Item Catalog Queries
+    This module provides the paginated and filterable catalog of items.
+    Pages are selected with keyset cursors on the sort column and the item ID,
+    so the cost of a page does not depend on its position or on the size of the catalog.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+from app import db
+from app.resource.category.model import Category
+from app.resource.item.model import Item
+from app.resource.storage_location.model import StorageLocation
+from app.resource.storage_location.storage import subtree_condition
+
+
+# Sort keys of the catalog and the columns they sort by, ties are broken by the item ID
+CATALOG_SORTS = {
+    'id': Item.id,
+    'name': Item.name,
+    'quantity': Item.current_quantity,
+    'updated': Item.stock_updated_at,
+}
+
+
+def encode_cursor(sort: str, item: Item) -> str:
+    """ Encode the position after an item into an opaque cursor.
+
+    Args:
+        sort (str): The sort key of the catalog.
+        item (Item): The last item of the page.
+
+    Returns:
+        str: The cursor.
+    """
+    value = getattr(item, CATALOG_SORTS[sort].key)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    data = json.dumps([value, item.id]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(sort: str, cursor: Optional[str]) -> Optional[Tuple[object, int]]:
+    """ Decode a cursor into the sort value and the ID of the last item of the previous page.
+
+    Args:
+        sort (str): The sort key of the catalog.
+        cursor (str): The cursor, as created by `encode_cursor`.
+
+    Returns:
+        tuple: The sort value and the item ID, or None if there is no valid cursor.
+    """
+    if not cursor:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, item_id = json.loads(data)
+        if value is not None and sort == 'updated':
+            value = datetime.fromisoformat(value)
+        return value, int(item_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _after_cursor(column, descending: bool, value, item_id: int):
+    """ Build the condition which selects the items after the cursor position.
+    NULL values are sorted first in ascending and last in descending order, on every database.
+    """
+    if not descending:
+        if value is None:
+            return db.or_(db.and_(column.is_(None), Item.id > item_id), column.is_not(None))
+        return db.or_(column > value, db.and_(column == value, Item.id > item_id))
+    if value is None:
+        return db.and_(column.is_(None), Item.id < item_id)
+    return db.or_(column < value, db.and_(column == value, Item.id < item_id), column.is_(None))
+
+
+def get_catalog_page(
+        category_id: Optional[int] = None,
+        storage_id: Optional[int] = None,
+        owner_id: Optional[int] = None,
+        sort: str = 'id',
+        descending: bool = False,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        options: Sequence = ()
+    ) -> Tuple[List[Item], Optional[str]]:
+    """ Get one page of the item catalog.
+
+    Args:
+        category_id (int): Only items with this category.
+        storage_id (int): Only items in this storage location or anywhere inside it.
+        owner_id (int): Only items of this owner.
+        sort (str): The sort key, one of `CATALOG_SORTS`.
+        descending (bool): Sort in descending order.
+        cursor (str): The cursor of the page, None for the first page.
+        limit (int): The maximum number of items on the page.
+        options (Sequence): Loader options for the query, see `app.utils.loading`.
+
+    Returns:
+        tuple: The items of the page and the cursor of the next page, None if this is the last page.
+    """
+    if sort not in CATALOG_SORTS:
+        sort = 'id'
+    column = CATALOG_SORTS[sort]
+    query = db.select(Item).options(*options)
+
+    if category_id:
+        query = query.where(Item.categories.any(Category.id == category_id))
+    if owner_id:
+        query = query.where(Item.owner_id == owner_id)
+    if storage_id:
+        storage = db.session.get(StorageLocation, storage_id)
+        if storage is None:
+            return [], None
+        query = query.join(StorageLocation, Item.storage_location_id == StorageLocation.id) \
+                     .where(subtree_condition(storage.path))
+
+    position = decode_cursor(sort, cursor)
+    if position is not None:
+        query = query.where(_after_cursor(column, descending, *position))
+
+    # NULLS FIRST and NULLS LAST are not supported by every database, NULL values are sorted by a key instead
+    if descending:
+        null_order = (column.is_(None).asc(),) if column.nullable else ()
+        query = query.order_by(*null_order, column.desc(), Item.id.desc())
+    else:
+        null_order = (column.is_(None).desc(),) if column.nullable else ()
+        query = query.order_by(*null_order, column.asc(), Item.id.asc())
+
+    items = db.session.execute(query.limit(limit + 1)).scalars().all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(sort, items[-1])
+    return items, next_cursor
@@ -0,0 +1,158 @@
+""" Retention of the stock history.
+    Every quantity change adds a row to `item_storage_stock`, so the table grows without limit.
+    The compaction keeps recent rows at full resolution and reduces older rows to one snapshot per item and day,
+    and rows older than that to one snapshot per item and week. A snapshot is the last row of its period,
+    the first row of an item is kept as well, it records when the item was created.
+    The removed rows are moved to `item_storage_stock_archive`.
+
+    The items are processed in batches by ID and every chunk of rows is archived and deleted in one transaction.
+    The compaction only selects rows which are still redundant, so an interrupted run can simply be repeated,
+    or continued after the last reported item ID.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional
+from app import db
+from app.resource.item.model import Item, ItemStorageStock, ItemStorageStockArchive
+
+
+def _day(column):
+    """ Get an SQL expression for the day of a timestamp column. """
+    if db.engine.dialect.name == 'postgresql':
+        return db.cast(db.func.date_trunc('day', column), db.Date)
+    return db.func.date(column)
+
+
+def _week(column):
+    """ Get an SQL expression for the first day of the week of a timestamp column.
+
+    Raises:
+        ValueError: If the database has no known expression for the week.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # the next Sunday, or the day itself, minus six days is the Monday of the week
+        return db.func.date(column, 'weekday 0', '-6 days')
+    if dialect == 'postgresql':
+        return db.cast(db.func.date_trunc('week', column), db.Date)
+    if dialect in ('mysql', 'mariadb'):
+        # WEEKDAY is the number of days since Monday
+        return db.func.subdate(db.func.date(column), db.func.weekday(column))
+    raise ValueError(f"Weekly compaction of the stock history is not supported on {dialect}")
+
+
+def find_redundant_stocks(item_ids: List[int], raw_before: datetime, weekly_before: datetime) -> List[int]:
+    """ Find the stock rows of some items which are replaced by the snapshot of their period.
+
+    Args:
+        item_ids (list): The IDs of the items.
+        raw_before (datetime): Rows before this time are compacted, newer rows are kept.
+        weekly_before (datetime): Rows before this time are compacted per week, newer rows per day.
+
+    Returns:
+        list: The IDs of the redundant stock rows.
+    """
+    timestamp = ItemStorageStock.timestamp
+    period = db.case(
+        (timestamp < weekly_before, _week(timestamp)),
+        else_=_day(timestamp)
+    )
+    ranked = (
+        db.select(
+            ItemStorageStock.id,
+            db.func.row_number().over(
+                partition_by=(ItemStorageStock.item_id, period),
+                order_by=(timestamp.desc(), ItemStorageStock.id.desc())
+            ).label('position_in_period'),
+            db.func.row_number().over(
+                partition_by=ItemStorageStock.item_id,
+                order_by=(timestamp, ItemStorageStock.id)
+            ).label('position_in_item'),
+        )
+        .where(ItemStorageStock.item_id.in_(item_ids), timestamp < raw_before)
+        .subquery()
+    )
+    return list(db.session.execute(
+        db.select(ranked.c.id)
+        .where(ranked.c.position_in_period > 1, ranked.c.position_in_item > 1)
+        .order_by(ranked.c.id)
+    ).scalars())
+
+
+def archive_stocks(stock_ids: List[int]) -> None:
+    """ Move stock rows to the archive and commit.
+
+    Args:
+        stock_ids (list): The IDs of the stock rows.
+
+    Returns:
+        None
+    """
+    archived_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    columns = ItemStorageStock.__table__.c
+    db.session.execute(
+        db.insert(ItemStorageStockArchive.__table__).from_select(
+            ['id', 'item_id', 'storage_location_id', 'quantity', 'timestamp', 'archived_at'],
+            db.select(
+                columns.id, columns.item_id, columns.storage_location_id, columns.quantity, columns.timestamp,
+                db.literal(archived_at, db.DateTime)
+            ).where(columns.id.in_(stock_ids))
+        )
+    )
+    db.session.execute(db.delete(ItemStorageStock.__table__).where(columns.id.in_(stock_ids)))
+    db.session.commit()
+
+
+def compact_stock_history(
+        raw_days: int,
+        daily_days: int,
+        batch_size: int = 1000,
+        item_batch_size: int = 100,
+        after_item_id: int = 0,
+        dry_run: bool = False,
+        progress: Optional[Callable] = None
+    ) -> int:
+    """ Compact the stock history of all items.
+
+    Args:
+        raw_days (int): The number of days which are kept at full resolution.
+        daily_days (int): The number of days, counted from now, with one snapshot per day, older rows keep one per week.
+        batch_size (int): The maximum number of rows archived per transaction.
+        item_batch_size (int): The number of items whose rows are selected with one query.
+        after_item_id (int): Continue an interrupted run after this item ID.
+        dry_run (bool): Only count the redundant rows.
+        progress (Callable): Called with the last processed item ID and the number of archived rows after every batch.
+
+    Raises:
+        ValueError: If `daily_days` is smaller than `raw_days` or the database does not support weekly snapshots.
+
+    Returns:
+        int: The number of archived rows.
+    """
+    if daily_days < raw_days:
+        raise ValueError("The daily snapshots must cover at least the raw history")
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    raw_before = now - timedelta(days=raw_days)
+    weekly_before = now - timedelta(days=daily_days)
+
+    archived = 0
+    last_item_id = after_item_id
+    while True:
+        item_ids = list(db.session.execute(
+            db.select(Item.id).where(Item.id > last_item_id).order_by(Item.id).limit(item_batch_size)
+        ).scalars())
+        if not item_ids:
+            break
+        last_item_id = item_ids[-1]
+
+        stock_ids = find_redundant_stocks(item_ids, raw_before, weekly_before)
+        for start in range(0, len(stock_ids), batch_size):
+            chunk = stock_ids[start:start + batch_size]
+            if not dry_run:
+                archive_stocks(chunk)
+            archived += len(chunk)
+        # end the read transaction of the batch, also in a dry run
+        db.session.commit()
+        if progress:
+            progress(last_item_id, archived)
+    return archived
@@ -0,0 +1,129 @@
+""" Streaming export of the items as CSV or JSON Lines.
+    The items are read with `yield_per` in partitions, so only one partition is held in memory at a time.
+    Storage paths and owners are resolved from maps which are loaded once,
+    the categories are loaded with one query per partition.
+    The columns are the ones of the import, an export can be imported again.
+"""
+
+import csv
+import io
+import json
+from typing import Dict, Iterator, List
+from app import db
+from app.resource.category.model import Category, item_category
+from app.resource.item.model import Item
+from app.resource.storage_location.tree import get_storage_tree
+from app.user.model import User
+
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_COLUMNS = ('id', 'name', 'description', 'storage', 'storage_id', 'quantity', 'categories', 'owner')
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def load_storage_paths() -> Dict[int, str]:
+    """ Get the paths of all storage locations from the cached storage tree.
+
+    Returns:
+        dict: The paths of names from the root, separated by '/', by storage location ID.
+    """
+    tree = get_storage_tree()
+    return {storage_id: '/'.join(tree.get_path_names(storage_id)) for storage_id in tree.nodes}
+
+
+def get_item_category_names(item_ids: List[int]) -> Dict[int, List[str]]:
+    """ Get the category names of a partition of items with one query.
+
+    Args:
+        item_ids (list): The IDs of the items.
+
+    Returns:
+        dict: The category names, sorted by name, by item ID.
+    """
+    names = {}
+    rows = db.session.execute(
+        db.select(item_category.c.item_id, Category.name)
+        .join(Category, Category.id == item_category.c.category_id)
+        .where(item_category.c.item_id.in_(item_ids))
+        .order_by(Category.name)
+    )
+    for item_id, name in rows:
+        names.setdefault(item_id, []).append(name)
+    return names
+
+
+def iter_export_records(batch_size: int = 1000) -> Iterator[dict]:
+    """ Iterate over all items as export records, ordered by ID.
+
+    Args:
+        batch_size (int): The number of items fetched per partition.
+
+    Returns:
+        Iterator: One dict with the `EXPORT_COLUMNS` per item.
+    """
+    storage_paths = load_storage_paths()
+    usernames = dict(db.session.execute(db.select(User.id, User.username)).all())
+
+    result = db.session.execute(
+        db.select(
+            Item.id, Item.name, Item.description, Item.storage_location_id,
+            Item.current_quantity, Item.owner_id
+        )
+        .order_by(Item.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in result.partitions():
+        categories = get_item_category_names([row.id for row in partition])
+        for row in partition:
+            yield {
+                'id': row.id,
+                'name': row.name,
+                'description': row.description or '',
+                'storage': storage_paths.get(row.storage_location_id, ''),
+                'storage_id': row.storage_location_id,
+                # an item without stock snapshot has an unknown quantity, it is exported empty and imported as such
+                'quantity': row.current_quantity,
+                'categories': categories.get(row.id, []),
+                'owner': usernames.get(row.owner_id, ''),
+            }
+
+
+def iter_export(fmt: str = 'csv', batch_size: int = 1000) -> Iterator[str]:
+    """ Serialize all items as CSV or JSON Lines.
+    The text is produced in chunks of `batch_size` items for a streamed response.
+
+    Args:
+        fmt (str): The format of the export, one of `EXPORT_FORMATS`.
+        batch_size (int): The number of items per chunk.
+
+    Raises:
+        ValueError: If the format is unknown.
+
+    Returns:
+        Iterator: The chunks of the export.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt}")
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, lineterminator='\n')
+    if fmt == 'csv':
+        writer.writeheader()
+
+    count = 0
+    for record in iter_export_records(batch_size):
+        if fmt == 'csv':
+            writer.writerow(dict(record, categories=';'.join(record['categories']), storage_id=record['storage_id'] or ''))
+        else:
+            buffer.write(json.dumps(record, ensure_ascii=False))
+            buffer.write('\n')
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
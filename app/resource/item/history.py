@@ -0,0 +1,136 @@
+""" The stock history of an item as a bounded time series.
+    Short histories are returned as they are. Long histories are averaged into time buckets by the database,
+    a few times more buckets than points are requested, and reduced to the requested number of points with LTTB.
+    Databases without a known epoch function stream the rows and average them into the same buckets.
+"""
+
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from app import db
+from app.resource.item.model import ItemStorageStock
+from app.utils.downsample import lttb
+
+
+# Number of buckets per requested point which are aggregated by the database before LTTB
+BUCKETS_PER_POINT = 4
+
+
+def _epoch(column):
+    """ Get an SQL expression for the seconds since the epoch of a timestamp column, None if unsupported. """
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return (db.func.julianday(column) - 2440587.5) * 86400.0
+    if dialect == 'postgresql':
+        return db.func.extract('epoch', column)
+    if dialect in ('mysql', 'mariadb'):
+        # UNIX_TIMESTAMP converts from the time zone of the session, the difference to the epoch does not
+        return db.func.timestampdiff(db.literal_column('MICROSECOND'), '1970-01-01 00:00:00', column) / 1000000.0
+    return None
+
+
+def _from_epoch(seconds: float) -> datetime:
+    """ Convert seconds since the epoch into a naive UTC timestamp like the stored ones. """
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+
+
+def _average_buckets(rows, origin: float, width: float) -> List[Tuple[float, float]]:
+    """ Average streamed rows, sorted by time, into buckets of `width` seconds from `origin`.
+    Only the running sums of the current bucket are kept, not the rows.
+    """
+    series = []
+    bucket = None
+    count = 0
+    seconds_sum = quantity_sum = 0.0
+    for timestamp, quantity in rows:
+        seconds = timestamp.replace(tzinfo=timezone.utc).timestamp()
+        current = int((seconds - origin) / width)
+        if current != bucket and count:
+            series.append((seconds_sum / count, quantity_sum / count))
+            count = 0
+            seconds_sum = quantity_sum = 0.0
+        bucket = current
+        count += 1
+        seconds_sum += seconds
+        quantity_sum += quantity or 0
+    if count:
+        series.append((seconds_sum / count, quantity_sum / count))
+    return series
+
+
+def get_stock_history(
+        item_id: int,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        max_points: int = 500
+    ) -> List[Tuple[datetime, int]]:
+    """ Get the quantity of an item over time with at most `max_points` points.
+    If the range has a start, the quantity at the start is the first point.
+
+    Args:
+        item_id (int): The ID of the item.
+        start (datetime): The start of the range as naive UTC timestamp, None for the first change.
+        end (datetime): The end of the range as naive UTC timestamp, None for the last change.
+        max_points (int): The maximum number of points.
+
+    Returns:
+        list: The timestamps and quantities, sorted by time.
+    """
+    conditions = [ItemStorageStock.item_id == item_id]
+    if start is not None:
+        conditions.append(ItemStorageStock.timestamp >= start)
+    if end is not None:
+        conditions.append(ItemStorageStock.timestamp <= end)
+
+    points = []
+    if start is not None:
+        previous = db.session.execute(
+            db.select(ItemStorageStock.quantity)
+            .where(ItemStorageStock.item_id == item_id, ItemStorageStock.timestamp < start)
+            .order_by(ItemStorageStock.timestamp.desc(), ItemStorageStock.id.desc())
+            .limit(1)
+        ).scalar()
+        if previous is not None:
+            points.append((start, previous))
+            max_points -= 1
+
+    count, first, last = db.session.execute(
+        db.select(
+            db.func.count(ItemStorageStock.id),
+            db.func.min(ItemStorageStock.timestamp),
+            db.func.max(ItemStorageStock.timestamp)
+        ).where(*conditions)
+    ).one()
+    rows = db.select(ItemStorageStock.timestamp, ItemStorageStock.quantity).where(*conditions)
+
+    if count <= max_points:
+        points.extend(
+            (timestamp, quantity or 0)
+            for timestamp, quantity in db.session.execute(rows.order_by(ItemStorageStock.timestamp, ItemStorageStock.id))
+        )
+        return points
+
+    origin = first.replace(tzinfo=timezone.utc).timestamp()
+    width = max((last - first).total_seconds(), 1.0) / (max_points * BUCKETS_PER_POINT)
+    epoch = _epoch(ItemStorageStock.timestamp)
+    if epoch is None:
+        series = _average_buckets(
+            db.session.execute(
+                rows.order_by(ItemStorageStock.timestamp, ItemStorageStock.id).execution_options(yield_per=5000)
+            ),
+            origin,
+            width
+        )
+    else:
+        bucket = db.cast((epoch - origin) / width, db.Integer)
+        series = [
+            (float(seconds), float(quantity or 0))
+            for seconds, quantity in db.session.execute(
+                db.select(db.func.avg(epoch), db.func.avg(ItemStorageStock.quantity))
+                .where(*conditions)
+                .group_by(bucket)
+                .order_by(bucket)
+            )
+        ]
+
+    points.extend((_from_epoch(seconds), round(quantity)) for seconds, quantity in lttb(series, max_points))
+    return points
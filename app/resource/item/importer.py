@@ -0,0 +1,334 @@
+""" Bulk import of items from CSV or JSON Lines.
+    The input is parsed as a stream, row by row, so its size does not matter.
+    Storage locations, categories and owners are resolved through lookup maps which are loaded once,
+    and the rows are written in batches with one executemany statement per table and batch.
+    Databases without `INSERT ... RETURNING` insert the items of a batch one by one to get their IDs.
+
+    Columns, the same keys are used for JSON Lines:
+        name (required): Name of the item.
+        description: Description of the item.
+        storage: Path of the storage location, the names from the root separated by '/', e.g. 'Garage/Shelf'.
+        storage_id: ID of the storage location, used if `storage` is empty.
+        quantity: Current quantity, defaults to 1 without the column, empty for an unknown quantity.
+        categories: Category names separated by ';', a list in JSON Lines.
+        owner: Username of the owner.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import Callable, Dict, IO, Iterator, List, Optional, Tuple
+from app import db
+from app.resource.category.model import Category, item_category
+from app.resource.dashboard.statistics import INVENTORY_VERSION
+from app.resource.data_version.model import bump_data_version
+from app.resource.item.model import Item, ItemStorageStock
+from app.resource.storage_location.tree import get_storage_tree
+from app.user.model import User
+
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+# Maximum number of errors kept in the result, all errors are counted
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportResult:
+    """ The outcome of an import.
+
+    Attributes:
+        created (int): Number of created items.
+        failed (int): Number of rows which were skipped because of an error.
+        errors (list): The line numbers and messages of the first `MAX_REPORTED_ERRORS` errors.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors: List[Tuple[int, str]] = []
+
+    def __repr__(self):
+        return f"<ImportResult {self.created} created, {self.failed} failed>"
+
+    def add_error(self, line: int, message: str) -> None:
+        """ Record a skipped row.
+
+        Args:
+            line (int): The line number of the row in the input.
+            message (str): Why the row was skipped.
+
+        Returns:
+            None
+        """
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def to_dict(self) -> dict:
+        """ Get the result for a JSON response.
+
+        Returns:
+            dict: The numbers of created and failed rows and the errors.
+        """
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': [{'line': line, 'message': message} for line, message in self.errors],
+        }
+
+
+def detect_import_format(filename: Optional[str]) -> str:
+    """ Detect the import format by the file extension.
+
+    Args:
+        filename (str): The name of the uploaded file.
+
+    Returns:
+        str: One of `IMPORT_FORMATS`, CSV if the extension is unknown.
+    """
+    if filename and filename.lower().rsplit('.', 1)[-1] in ('jsonl', 'ndjson', 'json'):
+        return 'jsonl'
+    return 'csv'
+
+
+def iter_import_rows(stream: IO[bytes], fmt: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """ Parse the rows of an import stream one by one.
+
+    Args:
+        stream (IO[bytes]): The binary input stream.
+        fmt (str): The format of the input, one of `IMPORT_FORMATS`.
+
+    Returns:
+        Iterator: The line number, the row as dict and None, or the line number, None and a parse error.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_number, None, f"invalid JSON: {error}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "a line must be a JSON object"
+            continue
+        yield line_number, row, None
+
+
+def _normalize_path(path: str) -> str:
+    """ Normalize a storage path for the lookup, the names are compared without surrounding spaces. """
+    return '/'.join(name.strip() for name in path.strip().strip('/').split('/'))
+
+
+def load_import_lookups() -> Tuple[Dict[str, int], Dict[int, int], Dict[str, int], Dict[str, int]]:
+    """ Load the lookup maps of an import with one query per table.
+
+    Returns:
+        tuple: Storage location IDs by path, existing storage location IDs, category IDs by lowercase name
+            and user IDs by username.
+    """
+    tree = get_storage_tree()
+    storages_by_path = {}
+    for storage_id in tree.nodes:
+        storages_by_path.setdefault(_normalize_path('/'.join(tree.get_path_names(storage_id))), storage_id)
+    storage_ids = {storage_id: storage_id for storage_id in tree.nodes}
+    categories = {
+        name.lower(): category_id
+        for category_id, name in db.session.execute(db.select(Category.id, Category.name))
+    }
+    users = dict(db.session.execute(db.select(User.username, User.id)).all())
+    return storages_by_path, storage_ids, categories, users
+
+
+def _parse_row(row: dict, lookups: tuple) -> Tuple[dict, List[int], Optional[int]]:
+    """ Validate a row and resolve its references.
+
+    Raises:
+        ValueError: If the row is invalid.
+
+    Returns:
+        tuple: The item values, the category IDs and the quantity, None if it is unknown.
+    """
+    storages_by_path, storage_ids, categories, users = lookups
+
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError("name is required")
+    if len(name) > 100:
+        raise ValueError("name is longer than 100 characters")
+    description = str(row.get('description') or '').strip() or None
+    if description is not None and len(description) > 512:
+        raise ValueError("description is longer than 512 characters")
+
+    storage_id = None
+    path = str(row.get('storage') or '').strip()
+    if path:
+        storage_id = storages_by_path.get(_normalize_path(path))
+        if storage_id is None:
+            raise ValueError(f"unknown storage location '{path}'")
+    elif row.get('storage_id') not in (None, ''):
+        try:
+            storage_id = storage_ids.get(int(row['storage_id']))
+        except (TypeError, ValueError):
+            storage_id = None
+        if storage_id is None:
+            raise ValueError(f"unknown storage location #{row['storage_id']}")
+
+    quantity = row.get('quantity', 1)
+    if quantity is None or str(quantity).strip() == '':
+        # an unknown quantity, e.g. of an exported item without stock, gets no stock snapshot
+        quantity = None
+    else:
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise ValueError(f"quantity '{quantity}' is not a number")
+        if quantity < 0:
+            raise ValueError("quantity must not be negative")
+
+    category_names = row.get('categories') or []
+    if isinstance(category_names, str):
+        category_names = category_names.split(';')
+    category_ids = []
+    for category_name in category_names:
+        category_name = str(category_name).strip()
+        if not category_name:
+            continue
+        category_id = categories.get(category_name.lower())
+        if category_id is None:
+            raise ValueError(f"unknown category '{category_name}'")
+        if category_id not in category_ids:
+            category_ids.append(category_id)
+
+    owner_id = None
+    owner = str(row.get('owner') or '').strip()
+    if owner:
+        owner_id = users.get(owner)
+        if owner_id is None:
+            raise ValueError(f"unknown owner '{owner}'")
+
+    values = {
+        'name': name,
+        'description': description,
+        'storage_location_id': storage_id,
+        'owner_id': owner_id,
+    }
+    return values, category_ids, quantity
+
+
+def _insert_items(item_rows: List[dict]) -> List[int]:
+    """ Insert the items of a batch and get their IDs in the order of the rows.
+    Databases without `INSERT ... RETURNING`, e.g. MySQL, insert the rows one by one
+    and read the ID of every row from the driver.
+    """
+    if db.engine.dialect.insert_returning:
+        return db.session.execute(
+            db.insert(Item).returning(Item.id, sort_by_parameter_order=True),
+            item_rows
+        ).scalars().all()
+    return [
+        db.session.execute(db.insert(Item.__table__).values(**row)).inserted_primary_key[0]
+        for row in item_rows
+    ]
+
+
+def _write_batch(batch: List[Tuple[dict, List[int], Optional[int]]]) -> None:
+    """ Insert the items of a batch with their stock and categories and commit them. """
+    from app.resource.search.index import reindex_items
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    # the stock snapshot is set directly, bulk inserts do not run the session events
+    item_rows = [
+        dict(values, current_quantity=quantity, stock_updated_at=now if quantity is not None else None)
+        for values, _, quantity in batch
+    ]
+    item_ids = _insert_items(item_rows)
+
+    stock_rows = [
+        {
+            'item_id': item_id,
+            'storage_location_id': values['storage_location_id'],
+            'quantity': quantity,
+            'timestamp': now,
+        }
+        for item_id, (values, _, quantity) in zip(item_ids, batch)
+        if quantity is not None
+    ]
+    if stock_rows:
+        db.session.execute(db.insert(ItemStorageStock), stock_rows)
+    category_rows = [
+        {'item_id': item_id, 'category_id': category_id}
+        for item_id, (_, category_ids, _) in zip(item_ids, batch)
+        for category_id in category_ids
+    ]
+    if category_rows:
+        db.session.execute(db.insert(item_category), category_rows)
+    reindex_items(item_ids)
+    bump_data_version(INVENTORY_VERSION)
+    db.session.commit()
+
+
+def import_items(
+        stream: IO[bytes],
+        fmt: str = 'csv',
+        batch_size: int = 1000,
+        progress: Optional[Callable] = None
+    ) -> ImportResult:
+    """ Import items from a CSV or JSON Lines stream.
+    Invalid rows are skipped and reported with their line number, the valid rows are imported.
+    Every batch is committed on its own, an aborted import keeps the batches written so far.
+
+    Args:
+        stream (IO[bytes]): The binary input stream.
+        fmt (str): The format of the input, one of `IMPORT_FORMATS`.
+        batch_size (int): The number of items per insert statement and transaction.
+        progress (Callable): Called with the number of processed rows after every batch.
+
+    Raises:
+        ValueError: If the format is unknown.
+
+    Returns:
+        ImportResult: The numbers of created and failed rows and the errors.
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown import format {fmt}")
+
+    lookups = load_import_lookups()
+    result = ImportResult()
+    batch = []
+    processed = 0
+    try:
+        for line, row, error in iter_import_rows(stream, fmt):
+            processed += 1
+            if error is None:
+                try:
+                    batch.append(_parse_row(row, lookups))
+                except ValueError as exception:
+                    error = str(exception)
+            if error is not None:
+                result.add_error(line, error)
+            if len(batch) >= batch_size:
+                _write_batch(batch)
+                result.created += len(batch)
+                batch = []
+                if progress:
+                    progress(processed)
+    except UnicodeDecodeError as exception:
+        # the rest of the input cannot be read, the rows parsed so far are still imported
+        result.add_error(processed + 1, f"the file is not UTF-8 encoded: {exception.reason}")
+    except csv.Error as exception:
+        result.add_error(processed + 1, f"invalid CSV: {exception}")
+    if batch:
+        _write_batch(batch)
+        result.created += len(batch)
+    if progress:
+        progress(processed)
+    return result
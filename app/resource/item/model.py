@@ -1,5 +1,9 @@
 """ This module defines the Item model for the database. """
 
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
 from app import db
 from app.user.model import User
 from app.resource.storage_location.model import StorageLocation
@@ -13,8 +17,10 @@ class Item(db.Model):
         id (int): Unique identifier for the item.
         name (str): Name of the item.
         description (str): Description of the item.
-        owner_id (str): ID of the user who owns the item.
+        owner_id (int): ID of the user who owns the item.
         storage_location_id (int): ID of the storage location where the item is stored.
+        current_quantity (int): Snapshot of the latest stock quantity, kept in sync with the stock history.
+        stock_updated_at (datetime): Timestamp of the stock record the snapshot was taken from.
 
     Relationships:
         owner (User): The user who owns the item.
@@ -23,10 +29,12 @@ class Item(db.Model):
     """
     __tablename__ = 'item'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     description = db.Column(db.String(512), nullable=True)
-    owner_id = db.Column(db.String(100), db.ForeignKey('users.id'), nullable=True)
-    storage_location_id = db.Column(db.Integer, db.ForeignKey('storage_location.id'), nullable=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    storage_location_id = db.Column(db.Integer, db.ForeignKey('storage_location.id'), nullable=True, index=True)
+    current_quantity = db.Column(db.Integer, nullable=True, index=True)
+    stock_updated_at = db.Column(db.DateTime, nullable=True, index=True)
 
     owner = db.relationship('User', backref='items')
     storage_location = db.relationship('StorageLocation', backref='items')
@@ -37,6 +45,7 @@ class Item(db.Model):
 
     def get_current_stock(self) -> int:
         """ Returns the current stock quantity of the item.
+        The quantity is read from the snapshot columns, so no query is issued.
 
         Args:
             None
@@ -45,8 +54,21 @@ class Item(db.Model):
             int: The current stock quantity of the item, or None if no stock record exists.
 
         """
-        stock = ItemStorageStock.query.filter_by(item_id=self.id).order_by(ItemStorageStock.timestamp.desc()).first()
-        return stock.quantity if stock else None
+        return self.current_quantity
+
+    def apply_stock(self, stock: 'ItemStorageStock') -> None:
+        """ Updates the current stock snapshot from a stock record.
+        Older records than the one the snapshot was taken from are ignored.
+
+        Args:
+            stock (ItemStorageStock): The stock record to apply.
+
+        Returns:
+            None
+        """
+        if self.stock_updated_at is None or stock.timestamp >= self.stock_updated_at:
+            self.current_quantity = stock.quantity
+            self.stock_updated_at = stock.timestamp
 
     def get_create_timestamp(self) -> str:
         """ Returns the creation timestamp of the item in a human-readable format.
@@ -73,8 +95,8 @@ class ItemImage(db.Model):
     """
     __tablename__ = 'item_image'
     id = db.Column(db.Integer, primary_key=True)
-    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False)
-    filename = db.Column(db.String(512), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False, index=True)
+    filename = db.Column(db.String(512), nullable=False, index=True)
 
     item = db.relationship('Item', backref='images')
 
@@ -95,6 +117,10 @@ class ItemStorageStock(db.Model):
         item (Item): The item associated with the stock record.
     """
     __tablename__ = 'item_storage_stock'
+    __table_args__ = (
+        # the history of an item is read in the order of time
+        db.Index('ix_item_storage_stock_item_id_timestamp', 'item_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False)
     storage_location_id = db.Column(db.Integer, db.ForeignKey('storage_location.id'), nullable=True)
@@ -116,3 +142,154 @@ class ItemStorageStock(db.Model):
             str: The formatted timestamp as a string.
         """
         return self.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ItemStorageStockArchive(db.Model):
+    """ Represents a stock record which was removed from the stock history by the compaction.
+    The records keep their ID and have no foreign keys, so items and storage locations can still be deleted.
+
+    Attributes:
+        id (int): The ID of the stock record in the stock history.
+        item_id (int): ID of the item for which the stock was recorded.
+        storage_location_id (int): ID of the storage location where the item was stored.
+        quantity (int): Quantity of the item in stock.
+        timestamp (datetime): Timestamp of when the stock record was created.
+        archived_at (datetime): Timestamp of when the stock record was archived.
+    """
+    __tablename__ = 'item_storage_stock_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    item_id = db.Column(db.Integer, nullable=False, index=True)
+    storage_location_id = db.Column(db.Integer, nullable=True)
+    quantity = db.Column(db.Integer, nullable=True)
+    timestamp = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<ItemStockArchive #{self.id} for Item #{self.item_id} with quantity {self.quantity}>"
+
+
+@event.listens_for(db.session, 'before_flush')
+def update_stock_snapshot(session, flush_context, instances) -> None:
+    """ Keeps the current stock snapshot of items in sync with new stock records.
+    The snapshot is written in the same flush, and therefore in the same transaction,
+    as the stock record itself.
+
+    Args:
+        session (Session): The session which is flushed.
+        flush_context (UOWTransaction): The internal flush context.
+        instances (list): Deprecated argument, always None.
+
+    Returns:
+        None
+    """
+    for obj in list(session.new):
+        if not isinstance(obj, ItemStorageStock):
+            continue
+        if obj.timestamp is None:
+            # same value as CURRENT_TIMESTAMP, which is UTC
+            obj.timestamp = datetime.now(timezone.utc).replace(tzinfo=None)
+        if obj.quantity is None:
+            obj.quantity = 1
+        item = obj.item
+        if item is None and obj.item_id is not None:
+            item = session.get(Item, obj.item_id)
+        if item is not None:
+            item.apply_stock(obj)
+
+
+def get_current_stocks(item_ids: Iterable[int], chunk_size: int = 500) -> Dict[int, int]:
+    """ Returns the current stock quantity of many items.
+    The latest stock record of each item is selected with a single window function query
+    per chunk of item ids, instead of one query per item.
+
+    Args:
+        item_ids (Iterable[int]): The IDs of the items.
+        chunk_size (int): The maximum number of item IDs per query.
+
+    Returns:
+        Dict[int, int]: The current stock quantity by item ID. Items without a stock record are missing.
+    """
+    item_ids = list(dict.fromkeys(item_ids))
+    stocks = {}
+    for start in range(0, len(item_ids), chunk_size):
+        chunk = item_ids[start:start + chunk_size]
+        ranked = (
+            db.select(
+                ItemStorageStock.item_id,
+                ItemStorageStock.quantity,
+                db.func.row_number().over(
+                    partition_by=ItemStorageStock.item_id,
+                    order_by=(ItemStorageStock.timestamp.desc(), ItemStorageStock.id.desc())
+                ).label('position')
+            )
+            .where(ItemStorageStock.item_id.in_(chunk))
+            .subquery()
+        )
+        rows = db.session.execute(
+            db.select(ranked.c.item_id, ranked.c.quantity).where(ranked.c.position == 1)
+        )
+        stocks.update({item_id: quantity for item_id, quantity in rows})
+    return stocks
+
+
+def backfill_current_stock(connection: Optional[Connection] = None, batch_size: int = 1000) -> int:
+    """ Fills the current stock snapshot of all items from the stock history.
+    This is required once for databases which were created before the snapshot existed.
+    The values are read and written through the column types, so the timestamps are stored in the format
+    of the `DateTime` type like the snapshots of new stock records, also if the history has older formats.
+
+    Args:
+        connection (Connection): The connection to use. Defaults to a new transaction of the engine.
+        batch_size (int): The maximum number of items per query.
+
+    Returns:
+        int: The number of updated items.
+    """
+    if connection is None:
+        with db.engine.begin() as connection:
+            return backfill_current_stock(connection, batch_size)
+
+    item = Item.__table__
+    stock = ItemStorageStock.__table__
+    update = (
+        item.update()
+        .where(item.c.id == db.bindparam('b_id'))
+        .values(
+            current_quantity=db.bindparam('b_quantity', type_=item.c.current_quantity.type),
+            stock_updated_at=db.bindparam('b_timestamp', type_=item.c.stock_updated_at.type)
+        )
+    )
+    updated = 0
+    last_id = 0
+    while True:
+        item_ids = connection.execute(
+            db.select(item.c.id).where(item.c.id > last_id).order_by(item.c.id).limit(batch_size)
+        ).scalars().all()
+        if not item_ids:
+            return updated
+        last_id = item_ids[-1]
+        ranked = (
+            db.select(
+                stock.c.item_id,
+                stock.c.quantity,
+                stock.c.timestamp,
+                db.func.row_number().over(
+                    partition_by=stock.c.item_id,
+                    order_by=(stock.c.timestamp.desc(), stock.c.id.desc())
+                ).label('position')
+            )
+            .where(stock.c.item_id.in_(item_ids))
+            .subquery()
+        )
+        latest = {
+            item_id: (quantity, timestamp)
+            for item_id, quantity, timestamp in connection.execute(
+                db.select(ranked.c.item_id, ranked.c.quantity, ranked.c.timestamp).where(ranked.c.position == 1)
+            )
+        }
+        rows = []
+        for item_id in item_ids:
+            quantity, timestamp = latest.get(item_id, (None, None))
+            rows.append({'b_id': item_id, 'b_quantity': quantity, 'b_timestamp': timestamp})
+        connection.execute(update, rows)
+        updated += len(item_ids)
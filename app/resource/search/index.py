@@ -0,0 +1,339 @@
+"""Full-Text Search Index
+    This module maintains a SQLite FTS5 index over items and storage locations and searches it.
+    The index covers the name, the description and the category names and is kept in sync
+    with ORM session events. Results are ranked by bm25.
+    On other database engines, or if SQLite was built without FTS5, the search falls back to LIKE.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.resource.category.model import Category, item_category, storage_category
+from app.resource.item.model import Item
+from app.resource.storage_location.model import StorageLocation
+
+
+SEARCH_TABLE = 'search_index'
+
+# bm25 weights of the columns kind, ref_id, name, description and categories
+SEARCH_WEIGHTS = (0.0, 0.0, 10.0, 1.0, 4.0)
+
+# lightweight table construct, the virtual table is not part of the model metadata
+search_table = db.table(
+    SEARCH_TABLE,
+    db.column('kind'),
+    db.column('ref_id'),
+    db.column('name'),
+    db.column('description'),
+    db.column('categories')
+)
+
+_available: Dict[str, bool] = {}
+
+
+def is_search_index_available() -> bool:
+    """ Check if the FTS5 search index exists in the database.
+
+    Returns:
+        bool: True if the search index can be used, False if the LIKE fallback has to be used.
+    """
+    url = str(db.engine.url)
+    if url not in _available:
+        available = False
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.connect() as connection:
+                available = connection.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': SEARCH_TABLE}
+                ).first() is not None
+        _available[url] = available
+    return _available[url]
+
+
+def ensure_search_index() -> bool:
+    """ Create the FTS5 search index if the database supports it, and fill it if it was just created.
+
+    Returns:
+        bool: True if the search index is available.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    _available.pop(str(db.engine.url), None)
+    if is_search_index_available():
+        return True
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                "kind UNINDEXED, ref_id UNINDEXED, name, description, categories, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            ))
+    except OperationalError:
+        # SQLite without FTS5
+        return False
+    _available[str(db.engine.url)] = True
+    rebuild_search_index()
+    db.session.commit()
+    return True
+
+
+def rebuild_search_index() -> None:
+    """ Rebuild the whole search index from the items and storage locations.
+    The changes are part of the current transaction and are not committed.
+
+    Returns:
+        None
+    """
+    if not is_search_index_available():
+        return
+    db.session.execute(search_table.delete())
+    _index_items(db.session.connection(), None)
+    _index_storages(db.session.connection(), None)
+
+
+def reindex_items(item_ids: Iterable[int], connection=None) -> None:
+    """ Update the search index entries of items, deleted items are removed from the index.
+
+    Args:
+        item_ids (Iterable[int]): The IDs of the items.
+        connection (Connection): The connection to use. Defaults to the connection of `db.session`.
+
+    Returns:
+        None
+    """
+    item_ids = list(item_ids)
+    if item_ids and is_search_index_available():
+        _index_items(connection or db.session.connection(), item_ids)
+
+
+def reindex_storages(storage_ids: Iterable[int], connection=None) -> None:
+    """ Update the search index entries of storage locations, deleted ones are removed from the index.
+
+    Args:
+        storage_ids (Iterable[int]): The IDs of the storage locations.
+        connection (Connection): The connection to use. Defaults to the connection of `db.session`.
+
+    Returns:
+        None
+    """
+    storage_ids = list(storage_ids)
+    if storage_ids and is_search_index_available():
+        _index_storages(connection or db.session.connection(), storage_ids)
+
+
+def _index_items(connection, item_ids: Optional[List[int]]) -> None:
+    """ Write the search index entries of the given items, or of all items if `item_ids` is None. """
+    categories = (
+        db.select(db.func.group_concat(Category.name, ' '))
+        .join(item_category, item_category.c.category_id == Category.id)
+        .where(item_category.c.item_id == Item.id)
+        .scalar_subquery()
+    )
+    _write_entries(connection, 'item', Item, categories, item_ids)
+
+
+def _index_storages(connection, storage_ids: Optional[List[int]]) -> None:
+    """ Write the search index entries of the given storage locations, or of all if `storage_ids` is None. """
+    categories = (
+        db.select(db.func.group_concat(Category.name, ' '))
+        .join(storage_category, storage_category.c.category_id == Category.id)
+        .where(storage_category.c.storage_location_id == StorageLocation.id)
+        .scalar_subquery()
+    )
+    _write_entries(connection, 'storage', StorageLocation, categories, storage_ids)
+
+
+def _write_entries(connection, kind: str, model, categories, ids: Optional[List[int]], chunk_size: int = 500) -> None:
+    """ Replace the search index entries of one kind, in chunks of IDs. """
+    chunks = [None] if ids is None else [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+    for chunk in chunks:
+        source = db.select(db.literal(kind), model.id, model.name, model.description, categories)
+        if chunk is not None:
+            connection.execute(
+                search_table.delete()
+                .where(search_table.c.kind == kind)
+                .where(search_table.c.ref_id.in_(chunk))
+            )
+            source = source.where(model.id.in_(chunk))
+        connection.execute(
+            search_table.insert().from_select(['kind', 'ref_id', 'name', 'description', 'categories'], source)
+        )
+
+
+def _has_changes(obj, *attributes: str) -> bool:
+    """ Check if any of the given attributes of an object has pending changes. """
+    state = db.inspect(obj)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+@event.listens_for(db.session, 'before_flush')
+def collect_search_changes(session, flush_context, instances) -> None:
+    """ Collect the items and storage locations whose category names change with the flush.
+    Renamed or deleted categories change the index entries of all items and storage locations they are assigned to.
+    These have to be collected before the flush, because the assignments of deleted categories are removed by it.
+
+    Args:
+        session (Session): The session which is flushed.
+        flush_context (UOWTransaction): The internal flush context.
+        instances (list): Deprecated argument, always None.
+
+    Returns:
+        None
+    """
+    category_ids = [
+        obj.id for obj in session.deleted if isinstance(obj, Category)
+    ] + [
+        obj.id for obj in session.dirty if isinstance(obj, Category) and _has_changes(obj, 'name')
+    ]
+    if not category_ids or not is_search_index_available():
+        return
+    pending = session.info.setdefault('search_pending', {'item': set(), 'storage': set()})
+    connection = session.connection()
+    pending['item'].update(connection.execute(
+        db.select(item_category.c.item_id).where(item_category.c.category_id.in_(category_ids))
+    ).scalars())
+    pending['storage'].update(connection.execute(
+        db.select(storage_category.c.storage_location_id).where(storage_category.c.category_id.in_(category_ids))
+    ).scalars())
+
+
+@event.listens_for(db.session, 'after_flush')
+def sync_search_index(session, flush_context) -> None:
+    """ Update the search index entries of all items and storage locations changed by the flush.
+    The entries are written in the same transaction as the changes.
+
+    Args:
+        session (Session): The session which was flushed.
+        flush_context (UOWTransaction): The internal flush context.
+
+    Returns:
+        None
+    """
+    pending = session.info.pop('search_pending', {'item': set(), 'storage': set()})
+    for obj in session.new | session.deleted:
+        if isinstance(obj, Item):
+            pending['item'].add(obj.id)
+        elif isinstance(obj, StorageLocation):
+            pending['storage'].add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Item) and _has_changes(obj, 'name', 'description', 'categories'):
+            pending['item'].add(obj.id)
+        elif isinstance(obj, StorageLocation) and _has_changes(obj, 'name', 'description', 'categories'):
+            pending['storage'].add(obj.id)
+    if not (pending['item'] or pending['storage']) or not is_search_index_available():
+        return
+    connection = session.connection()
+    reindex_items(pending['item'], connection)
+    reindex_storages(pending['storage'], connection)
+
+
+def _build_match_query(query: str) -> str:
+    """ Build a FTS5 query, which matches all words of the user input as prefixes.
+    Every word is quoted, so the user input cannot contain FTS5 syntax.
+
+    Args:
+        query (str): The user input.
+
+    Returns:
+        str: The FTS5 query, empty if the input contains no words.
+    """
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _search_ids(kind: str, query: str, limit: int) -> List[int]:
+    """ Search the index for one kind of entries, ranked by bm25. """
+    match = _build_match_query(query)
+    if not match:
+        return []
+    weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+    rows = db.session.execute(
+        text(
+            f"SELECT ref_id FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH :match AND kind = :kind "
+            f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT :limit"
+        ),
+        {'match': match, 'kind': kind, 'limit': limit}
+    )
+    return [int(ref_id) for ref_id, in rows]
+
+
+def _load_ordered(model, ids: List[int], options: Sequence = ()) -> List:
+    """ Load the objects with the given IDs, in the order of the IDs. """
+    if not ids:
+        return []
+    objects = {obj.id: obj for obj in db.session.execute(
+        db.select(model).where(model.id.in_(ids)).options(*options)
+    ).scalars()}
+    return [objects[obj_id] for obj_id in ids if obj_id in objects]
+
+
+def _like_condition(model, categories, query: str):
+    """ Build the LIKE fallback condition over name, description and category names. """
+    pattern = f"%{query}%"
+    return db.or_(
+        model.name.ilike(pattern),
+        model.description.ilike(pattern),
+        categories.any(Category.name.ilike(pattern))
+    )
+
+
+def get_search_limit(limit: Optional[int] = None) -> int:
+    """ Get the maximum number of results per kind.
+
+    Args:
+        limit (int): An explicit limit, defaults to the `SEARCH_RESULT_LIMIT` setting.
+
+    Returns:
+        int: The maximum number of results.
+    """
+    return limit or current_app.config.get('SEARCH_RESULT_LIMIT', 50)
+
+
+def search_items(query: str, limit: Optional[int] = None, options: Sequence = ()) -> List[Item]:
+    """ Search items by name, description and category names.
+
+    Args:
+        query (str): The user input.
+        limit (int): The maximum number of results, defaults to the `SEARCH_RESULT_LIMIT` setting.
+        options (Sequence): Loader options for the query, see `app.utils.loading`.
+
+    Returns:
+        list: The matching items, the best match first.
+    """
+    limit = get_search_limit(limit)
+    if is_search_index_available():
+        return _load_ordered(Item, _search_ids('item', query, limit), options)
+    return db.session.execute(
+        db.select(Item)
+        .options(*options)
+        .where(_like_condition(Item, Item.categories, query))
+        .order_by(Item.name)
+        .limit(limit)
+    ).scalars().all()
+
+
+def search_storages(query: str, limit: Optional[int] = None, options: Sequence = ()) -> List[StorageLocation]:
+    """ Search storage locations by name, description and category names.
+
+    Args:
+        query (str): The user input.
+        limit (int): The maximum number of results, defaults to the `SEARCH_RESULT_LIMIT` setting.
+        options (Sequence): Loader options for the query, see `app.utils.loading`.
+
+    Returns:
+        list: The matching storage locations, the best match first.
+    """
+    limit = get_search_limit(limit)
+    if is_search_index_available():
+        return _load_ordered(StorageLocation, _search_ids('storage', query, limit), options)
+    return db.session.execute(
+        db.select(StorageLocation)
+        .options(*options)
+        .where(_like_condition(StorageLocation, StorageLocation.categories, query))
+        .order_by(StorageLocation.name)
+        .limit(limit)
+    ).scalars().all()
@@ -1,13 +1,34 @@
 """ This module defines the StorageLocation model for the database. """
+from typing import List
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import set_committed_value
 from app import db
+from app.resource.data_version.model import bump_data_version
+
+
+# Name of the data version which changes with the storage location tree
+STORAGE_VERSION = 'storage'
+
 
 class StorageLocation(db.Model):
+    """ Represents a storage location, storage locations are nested in a tree.
+
+    Attributes:
+        id (int): Unique identifier for the storage location.
+        name (str): Name of the storage location.
+        parent_id (int): ID of the parent storage location, None for root storage locations.
+        description (str): Description of the storage location.
+        path (str): Materialized path of the IDs from the root to this storage location, e.g. '/1/5/9/'.
+        depth (int): Number of ancestors of the storage location, 0 for root storage locations.
+    """
     __tablename__ = 'storage_location'
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    parent_id = db.Column(db.Integer, db.ForeignKey('storage_location.id'), nullable=True)
+    parent_id = db.Column(db.Integer, db.ForeignKey('storage_location.id'), nullable=True, index=True)
     description = db.Column(db.Text, nullable=True)
+    path = db.Column(db.String(512), nullable=True, index=True)
+    depth = db.Column(db.Integer, nullable=True)
 
     parent = db.relationship('StorageLocation', remote_side=[id], backref='children')
     categories = db.relationship('Category', secondary='storage_category', back_populates='storage_locations')
@@ -15,25 +36,113 @@ class StorageLocation(db.Model):
     def __repr__(self):
         return f"<StorageLocation #{self.id} {self.name}>"
 
+    def get_ancestor_ids(self) -> List[int]:
+        """ Get the IDs from the root storage location to the current storage location.
+        The IDs are read from the materialized path, so no query is issued.
+
+        Returns:
+            List[int]: The IDs from the root to the current storage location, empty if the path is not built yet.
+        """
+        if not self.path:
+            return []
+        return [int(part) for part in self.path.strip('/').split('/')]
+
     def get_root(self) -> 'StorageLocation':
         """ Get the root storage location of the current storage location.
-        This method traverses up the parent chain until it finds the root storage location.
+        The root is taken from the materialized path. Only if the path is not built yet,
+        this method traverses up the parent chain until it finds the root storage location.
 
         Returns:
             StorageLocation: The root storage location.
         """
+        ancestor_ids = self.get_ancestor_ids()
+        if ancestor_ids:
+            root = db.session.get(StorageLocation, ancestor_ids[0])
+            if root is not None:
+                return root
         current = self
         while current.parent is not None:
             current = current.parent
         return current
 
 
+def build_storage_path(parent_path: str, storage_id: int) -> str:
+    """ Build the materialized path of a storage location.
+
+    Args:
+        parent_path (str): The path of the parent storage location, None for root storage locations.
+        storage_id (int): The ID of the storage location.
+
+    Returns:
+        str: The materialized path of the storage location.
+    """
+    return f"{parent_path or '/'}{storage_id}/"
+
+
+@event.listens_for(StorageLocation, 'after_insert')
+def set_storage_path(mapper, connection, target) -> None:
+    """ Set the materialized path of a new storage location, right after it has been inserted.
+
+    Args:
+        mapper (Mapper): The mapper of the StorageLocation model.
+        connection (Connection): The connection the insert was executed on.
+        target (StorageLocation): The inserted storage location.
+
+    Returns:
+        None
+    """
+    parent_path, parent_depth = None, -1
+    if target.parent_id is not None:
+        parent = connection.execute(
+            db.select(StorageLocation.path, StorageLocation.depth).where(StorageLocation.id == target.parent_id)
+        ).first()
+        if parent is not None:
+            if parent.path is None:
+                # the paths have not been built yet, see `rebuild_storage_paths`
+                return
+            parent_path, parent_depth = parent.path, parent.depth
+    path = build_storage_path(parent_path, target.id)
+    depth = parent_depth + 1
+    connection.execute(
+        db.update(StorageLocation.__table__)
+        .where(StorageLocation.__table__.c.id == target.id)
+        .values(path=path, depth=depth)
+    )
+    set_committed_value(target, 'path', path)
+    set_committed_value(target, 'depth', depth)
+
+
+@event.listens_for(db.session, 'before_flush')
+def bump_storage_version(session, flush_context, instances) -> None:
+    """ Bump the storage version when storage locations are created, renamed, moved or deleted.
+    The new version is written in the same transaction as the changes.
+
+    Args:
+        session (Session): The session which is flushed.
+        flush_context (UOWTransaction): The internal flush context.
+        instances (list): Deprecated argument, always None.
+
+    Returns:
+        None
+    """
+    for obj in session.new | session.deleted:
+        if isinstance(obj, StorageLocation):
+            bump_data_version(STORAGE_VERSION, session)
+            return
+    for obj in session.dirty:
+        if isinstance(obj, StorageLocation) and session.is_modified(obj, include_collections=False):
+            state = db.inspect(obj)
+            if state.attrs.name.history.has_changes() or state.attrs.parent_id.history.has_changes():
+                bump_data_version(STORAGE_VERSION, session)
+                return
+
+
 class StorageLocationImage(db.Model):
     __tablename__ = 'storage_location_image'
 
     id = db.Column(db.Integer, primary_key=True)
     storage_location_id = db.Column(db.Integer, db.ForeignKey('storage_location.id'), nullable=False)
-    filename = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False, index=True)
     storage_location = db.relationship('StorageLocation', backref='images')
 
     def __repr__(self):
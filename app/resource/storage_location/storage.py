@@ -2,8 +2,66 @@
     This module provides functions to manage and retrieve storage location hierarchies.
 """
 
-from typing import List
-from app.resource.storage_location.model import StorageLocation
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import aliased
+from app import db
+from app.resource.category.model import item_category, storage_category
+from app.resource.item.model import Item, ItemImage, ItemStorageStock, ItemStorageStockArchive
+from app.resource.dashboard.statistics import INVENTORY_VERSION
+from app.resource.data_version.model import bump_data_version
+from app.resource.storage_location.model import StorageLocation, StorageLocationImage, STORAGE_VERSION, \
+                                                build_storage_path
+
+
+# Maximum number of levels followed upwards, protects against cyclic parent references
+MAX_STORAGE_DEPTH = 64
+
+# What happens to the items of a deleted storage location:
+# rehome moves them to the parent of the deleted storage location, delete deletes them with their images and stock
+STORAGE_DELETE_POLICIES = ('rehome', 'delete')
+
+
+def get_storage_ancestors(storage_id) -> Tuple[List[StorageLocation], List[int]]:
+    """ Get the storage hierarchy from the root to the current storage location with a single query.
+    The ancestors are resolved with a recursive CTE, which stops after `MAX_STORAGE_DEPTH` levels.
+    A cyclic parent reference therefore cannot loop forever, the hierarchy is cut where it repeats.
+
+    Args:
+        storage_id (int): The ID of the storage location to start from.
+
+    Returns:
+        tuple: The list of StorageLocation objects and the list of their IDs,
+            both ordered from the root to the current storage location.
+    """
+    if not storage_id:
+        return [], []
+
+    ancestors = (
+        db.select(StorageLocation.id, StorageLocation.parent_id, db.literal(0).label('depth'))
+        .where(StorageLocation.id == storage_id)
+        .cte('ancestors', recursive=True)
+    )
+    parent = aliased(StorageLocation)
+    ancestors = ancestors.union_all(
+        db.select(parent.id, parent.parent_id, ancestors.c.depth + 1)
+        .where(parent.id == ancestors.c.parent_id)
+        .where(ancestors.c.depth < MAX_STORAGE_DEPTH)
+    )
+    storages = db.session.execute(
+        db.select(StorageLocation)
+        .join(ancestors, StorageLocation.id == ancestors.c.id)
+        .order_by(ancestors.c.depth)
+    ).scalars()
+
+    hierarchy = []
+    seen = set()
+    for storage in storages:
+        if storage.id in seen:
+            break
+        seen.add(storage.id)
+        hierarchy.insert(0, storage)  # vorne anfügen für Reihenfolge von oben nach unten
+    return hierarchy, [storage.id for storage in hierarchy]
 
 
 def get_storage_hierarchy_ids(storage_id) -> List[int]:
@@ -15,16 +73,7 @@ def get_storage_hierarchy_ids(storage_id) -> List[int]:
     Returns:
         list: A list of storage location IDs representing the hierarchy from root to the current storage location.
     """
-    hierarchy = []
-    current_id = storage_id
-    while current_id:
-        hierarchy.insert(0, current_id)  # vorne anfügen für Reihenfolge von oben nach unten
-        storage = StorageLocation.query.filter_by(id=current_id).first()
-        if storage and storage.parent_id:
-            current_id = storage.parent_id
-        else:
-            break
-    return hierarchy
+    return get_storage_ancestors(storage_id)[1]
 
 
 def get_storage_hierarchy(storage_id) -> List[StorageLocation]:
@@ -36,13 +85,311 @@ def get_storage_hierarchy(storage_id) -> List[StorageLocation]:
     Returns:
         list: A list of StorageLocation objects representing the hierarchy from root to the current storage location.
     """
-    hierarchy = []
-    current_id = storage_id
-    while current_id:
-        storage = StorageLocation.query.filter_by(id=current_id).first()
-        if storage:
-            hierarchy.insert(0, storage)  # vorne anfügen für Reihenfolge von oben nach unten
-            current_id = storage.parent_id
+    return get_storage_ancestors(storage_id)[0]
+
+
+def subtree_condition(path: str):
+    """ Build the SQL condition which matches a storage location and all storage locations inside it.
+    The condition is a range on the indexed materialized path. The next character after '/' is '0',
+    so every path which starts with `path` is lower than `path` with its last '/' replaced by '0'.
+
+    Args:
+        path (str): The materialized path of the storage location.
+
+    Returns:
+        ColumnElement: The condition on `StorageLocation.path`.
+    """
+    return db.and_(StorageLocation.path >= path, StorageLocation.path < path[:-1] + '0')
+
+
+def get_storage_subtree(storage: StorageLocation) -> List[StorageLocation]:
+    """ Get a storage location and all storage locations inside it, at any depth.
+
+    Args:
+        storage (StorageLocation): The storage location to start from.
+
+    Returns:
+        list: The storage locations of the subtree, ordered by their path.
+    """
+    ensure_storage_paths()
+    return db.session.execute(
+        db.select(StorageLocation)
+        .where(subtree_condition(storage.path))
+        .order_by(StorageLocation.path)
+    ).scalars().all()
+
+
+def get_storage_subtree_ids(storage: StorageLocation) -> List[int]:
+    """ Get the IDs of a storage location and all storage locations inside it, at any depth.
+
+    Args:
+        storage (StorageLocation): The storage location to start from.
+
+    Returns:
+        list: The IDs of the storage locations of the subtree.
+    """
+    ensure_storage_paths()
+    return db.session.execute(
+        db.select(StorageLocation.id).where(subtree_condition(storage.path))
+    ).scalars().all()
+
+
+def count_items_in_subtree(storage: StorageLocation) -> int:
+    """ Count the items stored in a storage location or anywhere inside it.
+
+    Args:
+        storage (StorageLocation): The storage location to start from.
+
+    Returns:
+        int: The number of items in the subtree.
+    """
+    ensure_storage_paths()
+    return db.session.execute(
+        db.select(db.func.count(Item.id))
+        .join(StorageLocation, Item.storage_location_id == StorageLocation.id)
+        .where(subtree_condition(storage.path))
+    ).scalar()
+
+
+def move_storage(storage: StorageLocation, parent_id: Optional[int]) -> None:
+    """ Move a storage location, with everything inside it, into another parent storage location.
+    The materialized paths of the whole subtree are updated with a single statement.
+    The changes are part of the current transaction and are not committed.
+
+    Args:
+        storage (StorageLocation): The storage location to move.
+        parent_id (int): The ID of the new parent storage location, None to make it a root storage location.
+
+    Raises:
+        ValueError: If the parent does not exist, or if it is the storage location itself
+            or inside of it, which would create a cycle.
+
+    Returns:
+        None
+    """
+    ensure_storage_paths()
+    parent = None
+    if parent_id is not None:
+        parent = db.session.get(StorageLocation, parent_id)
+        if parent is None:
+            raise ValueError(f'Storage location #{parent_id} does not exist.')
+        if parent.path.startswith(storage.path):
+            raise ValueError(f'Storage location #{parent_id} is inside of storage location #{storage.id}.')
+
+    old_path = storage.path
+    new_path = build_storage_path(parent.path if parent else None, storage.id)
+    depth_change = (parent.depth + 1 if parent else 0) - storage.depth
+    storage.parent_id = parent_id
+    if new_path == old_path:
+        return
+    db.session.execute(
+        db.update(StorageLocation)
+        .where(subtree_condition(old_path))
+        .values(
+            path=db.literal(new_path) + db.func.substr(StorageLocation.path, len(old_path) + 1),
+            depth=StorageLocation.depth + depth_change
+        )
+        .execution_options(synchronize_session='fetch')
+    )
+
+
+def ensure_storage_paths(connection: Optional[Connection] = None) -> None:
+    """ Build the materialized paths if any storage location has none yet.
+    This is the case for databases which were created before the paths existed.
+
+    Args:
+        connection (Connection): The connection to use, e.g. of a migration. Defaults to `db.session`.
+
+    Returns:
+        None
+    """
+    executor = connection if connection is not None else db.session
+    missing = executor.execute(
+        db.select(StorageLocation.id).where(StorageLocation.path.is_(None)).limit(1)
+    ).first()
+    if missing is not None:
+        rebuild_storage_paths(connection)
+
+
+def rebuild_storage_paths(connection: Optional[Connection] = None) -> int:
+    """ Rebuild the materialized paths of all storage locations from their parent IDs.
+    A cycle of parent references is cut by making one of its storage locations a root storage location.
+    The changes are part of the current transaction and are not committed.
+
+    Args:
+        connection (Connection): The connection to use, e.g. of a migration. Defaults to `db.session`.
+
+    Returns:
+        int: The number of storage locations.
+    """
+    executor = connection if connection is not None else db.session
+    table = StorageLocation.__table__
+    parents: Dict[int, Optional[int]] = dict(
+        executor.execute(db.select(table.c.id, table.c.parent_id)).all()
+    )
+    # cut cycles at the storage location where the walk up the parents repeats
+    checked = set()
+    for storage_id in parents:
+        walked = []
+        current = storage_id
+        while current is not None and current not in checked:
+            if current in walked:
+                parents[current] = None
+                break
+            walked.append(current)
+            current = parents.get(current)
+        checked.update(walked)
+
+    paths: Dict[int, str] = {}
+    for storage_id in parents:
+        chain = []
+        current = storage_id
+        while current in parents and current not in paths:
+            chain.append(current)
+            current = parents[current]
+        for chain_id in reversed(chain):
+            if parents[chain_id] not in parents:
+                # root storage location or parent which does not exist anymore
+                parents[chain_id] = None
+            paths[chain_id] = build_storage_path(paths.get(parents[chain_id]), chain_id)
+
+    rows = [
+        {
+            'b_id': storage_id,
+            'b_parent_id': parents[storage_id],
+            'b_path': path,
+            'b_depth': path.count('/') - 2
+        }
+        for storage_id, path in paths.items()
+    ]
+    if rows:
+        executor.execute(
+            table.update()
+            .where(table.c.id == db.bindparam('b_id'))
+            .values(parent_id=db.bindparam('b_parent_id'), path=db.bindparam('b_path'), depth=db.bindparam('b_depth')),
+            rows
+        )
+        bump_data_version(STORAGE_VERSION, executor)
+        if connection is None:
+            for obj in list(db.session.identity_map.values()):
+                if isinstance(obj, StorageLocation):
+                    db.session.expire(obj, ['parent_id', 'path', 'depth'])
+    return len(rows)
+
+
+def _chunks(ids: List[int], size: int):
+    """ Split a list of IDs into chunks of at most `size` IDs. """
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def delete_storage_subtree(
+        storage_id: int,
+        policy: str = 'rehome',
+        batch_size: int = 500,
+        progress: Optional[Callable] = None
+    ) -> Dict[str, int]:
+    """ Delete a storage location and all storage locations inside it, at any depth.
+    The rows are deleted with set-based statements in batches of `batch_size` IDs, each batch is committed.
+    Storage locations are deleted from the deepest level upwards, an interrupted deletion leaves a valid tree
+    and can be repeated. The stock history of the deleted storage locations is kept, its rows point to the parent
+    (rehome) or to no storage location (delete). The image files are released after the rows are committed.
+
+    Args:
+        storage_id (int): The ID of the storage location to delete.
+        policy (str): What happens to the contained items, one of `STORAGE_DELETE_POLICIES`.
+        batch_size (int): The maximum number of IDs per statement.
+        progress (Callable): Called with the number of processed and of all items and storage locations.
+
+    Raises:
+        ValueError: If the storage location does not exist or the policy is unknown.
+
+    Returns:
+        dict: The number of deleted storage locations, of moved or deleted items and of deleted image files.
+    """
+    from app.resource.search.index import reindex_items, reindex_storages
+    from app.utils.image_store import release_images
+
+    if policy not in STORAGE_DELETE_POLICIES:
+        raise ValueError(f"Unknown policy {policy}")
+    storage = db.session.get(StorageLocation, storage_id)
+    if storage is None:
+        raise ValueError(f"Storage location #{storage_id} does not exist")
+    ensure_storage_paths()
+    parent_id = storage.parent_id
+    path = storage.path
+
+    storage_ids = db.session.execute(
+        db.select(StorageLocation.id)
+        .where(subtree_condition(path))
+        .order_by(StorageLocation.depth.desc(), StorageLocation.id)
+    ).scalars().all()
+    item_ids = db.session.execute(
+        db.select(Item.id)
+        .join(StorageLocation, Item.storage_location_id == StorageLocation.id)
+        .where(subtree_condition(path))
+        .order_by(Item.id)
+    ).scalars().all()
+
+    total = len(item_ids) + len(storage_ids)
+    done = 0
+    item_images = []
+    storage_images = []
+    if progress:
+        progress(done, total)
+
+    for chunk in _chunks(item_ids, batch_size):
+        if policy == 'rehome':
+            db.session.execute(
+                db.update(Item.__table__).where(Item.id.in_(chunk)).values(storage_location_id=parent_id)
+            )
         else:
-            break
-    return hierarchy
+            item_images.extend(db.session.execute(
+                db.select(ItemImage.filename).where(ItemImage.item_id.in_(chunk))
+            ).scalars())
+            db.session.execute(db.delete(ItemImage.__table__).where(ItemImage.item_id.in_(chunk)))
+            db.session.execute(db.delete(ItemStorageStock.__table__).where(ItemStorageStock.item_id.in_(chunk)))
+            db.session.execute(
+                db.delete(ItemStorageStockArchive.__table__).where(ItemStorageStockArchive.item_id.in_(chunk))
+            )
+            db.session.execute(db.delete(item_category).where(item_category.c.item_id.in_(chunk)))
+            db.session.execute(db.delete(Item.__table__).where(Item.id.in_(chunk)))
+            reindex_items(chunk)
+        bump_data_version(INVENTORY_VERSION)
+        db.session.commit()
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+
+    for chunk in _chunks(storage_ids, batch_size):
+        storage_images.extend(db.session.execute(
+            db.select(StorageLocationImage.filename).where(StorageLocationImage.storage_location_id.in_(chunk))
+        ).scalars())
+        db.session.execute(
+            db.delete(StorageLocationImage.__table__).where(StorageLocationImage.storage_location_id.in_(chunk))
+        )
+        db.session.execute(db.delete(storage_category).where(storage_category.c.storage_location_id.in_(chunk)))
+        # items stored after the item phase started and the stock history keep a valid storage location
+        db.session.execute(
+            db.update(Item.__table__).where(Item.storage_location_id.in_(chunk)).values(storage_location_id=parent_id)
+        )
+        db.session.execute(
+            db.update(ItemStorageStock.__table__)
+            .where(ItemStorageStock.storage_location_id.in_(chunk))
+            .values(storage_location_id=parent_id if policy == 'rehome' else None)
+        )
+        db.session.execute(db.delete(StorageLocation.__table__).where(StorageLocation.id.in_(chunk)))
+        reindex_storages(chunk)
+        bump_data_version(STORAGE_VERSION)
+        bump_data_version(INVENTORY_VERSION)
+        db.session.commit()
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+
+    images = release_images('item', item_images) + release_images('storage', storage_images)
+    return {
+        'storages': len(storage_ids),
+        'items': len(item_ids),
+        'images': images,
+    }
@@ -0,0 +1,176 @@
+"""Storage Location Tree Snapshot
+    This module provides an in-memory snapshot of the whole storage location tree.
+    The tree is built from a single query and is cached per request and per process.
+    The process cache is invalidated through the 'storage' data version,
+    which is bumped whenever a storage location is created, renamed, moved or deleted.
+"""
+
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from flask import g
+from app import db
+from app.resource.data_version.model import get_data_version
+from app.resource.storage_location.model import StorageLocation, STORAGE_VERSION
+
+
+class StorageNode:
+    """ A storage location in the tree snapshot.
+
+    Attributes:
+        id (int): ID of the storage location.
+        name (str): Name of the storage location.
+        parent_id (int): ID of the parent storage location, None for root storage locations.
+        parent (StorageNode): The parent node, None for root storage locations.
+        children (list): The child nodes.
+        root (StorageNode): The root node of the tree the storage location is in.
+    """
+    __slots__ = ('id', 'name', 'parent_id', 'parent', 'children', 'root')
+
+    def __init__(self, storage_id: int, name: str, parent_id: Optional[int]):
+        self.id = storage_id
+        self.name = name
+        self.parent_id = parent_id
+        self.parent = None
+        self.children = []
+        self.root = self
+
+    def __repr__(self):
+        return f"<StorageNode #{self.id} {self.name}>"
+
+
+class StorageTree:
+    """ In-memory snapshot of all storage locations and their parent-child relations.
+
+    Attributes:
+        nodes (dict): The nodes by the ID of their storage location.
+        roots (list): The root nodes.
+    """
+
+    def __init__(self, rows: List[Tuple[int, Optional[int], str]]):
+        """ Build the tree from (id, parent_id, name) rows.
+        Nodes with a parent which does not exist, or which are part of a cycle, are treated as roots.
+
+        Args:
+            rows (list): The (id, parent_id, name) rows of all storage locations.
+        """
+        self.nodes: Dict[int, StorageNode] = {
+            storage_id: StorageNode(storage_id, name, parent_id) for storage_id, parent_id, name in rows
+        }
+        for node in self.nodes.values():
+            parent = self.nodes.get(node.parent_id)
+            if parent is not None:
+                node.parent = parent
+                parent.children.append(node)
+        for node in self.nodes.values():
+            self._resolve_root(node)
+        self.roots: List[StorageNode] = [node for node in self.nodes.values() if node.parent is None]
+
+    def _resolve_root(self, node: StorageNode) -> None:
+        """ Set the root of a node and of all its unresolved ancestors. """
+        chain = []
+        current = node
+        while current.parent is not None and current.root is current and current not in chain:
+            chain.append(current)
+            current = current.parent
+        if current in chain:
+            # cycle, make the storage location where it repeats a root
+            current.parent.children.remove(current)
+            current.parent = None
+        for chained in chain:
+            chained.root = current.root
+
+    def get(self, storage_id: Optional[int]) -> Optional[StorageNode]:
+        """ Get the node of a storage location.
+
+        Args:
+            storage_id (int): The ID of the storage location.
+
+        Returns:
+            StorageNode: The node, or None if the storage location does not exist.
+        """
+        return self.nodes.get(storage_id)
+
+    def get_root(self, storage_id: Optional[int]) -> Optional[StorageNode]:
+        """ Get the root node of the tree a storage location is in.
+
+        Args:
+            storage_id (int): The ID of the storage location.
+
+        Returns:
+            StorageNode: The root node, or None if the storage location does not exist.
+        """
+        node = self.nodes.get(storage_id)
+        return node.root if node else None
+
+    def get_children(self, storage_id: Optional[int]) -> List[StorageNode]:
+        """ Get the child nodes of a storage location.
+
+        Args:
+            storage_id (int): The ID of the storage location, None for the root storage locations.
+
+        Returns:
+            list: The child nodes.
+        """
+        if storage_id is None:
+            return self.roots
+        node = self.nodes.get(storage_id)
+        return node.children if node else []
+
+    def get_path_names(self, storage_id: Optional[int]) -> List[str]:
+        """ Get the names from the root to a storage location.
+
+        Args:
+            storage_id (int): The ID of the storage location.
+
+        Returns:
+            list: The names from the root to the storage location.
+        """
+        names = []
+        node = self.nodes.get(storage_id)
+        while node is not None:
+            names.insert(0, node.name)
+            node = node.parent
+        return names
+
+
+_tree_cache: Dict[str, Tuple[int, StorageTree]] = {}
+_tree_cache_lock = Lock()
+
+
+def load_storage_tree() -> StorageTree:
+    """ Build the storage tree from the database with a single query.
+
+    Returns:
+        StorageTree: The storage tree.
+    """
+    rows = db.session.execute(
+        db.select(StorageLocation.id, StorageLocation.parent_id, StorageLocation.name)
+        .order_by(StorageLocation.id)
+    ).all()
+    return StorageTree(rows)
+
+
+def get_storage_tree() -> StorageTree:
+    """ Get the storage tree from the cache.
+    Within a request the tree is resolved once. Across requests it is reused
+    as long as the storage version has not changed.
+    The tree is shared, so it must not be modified.
+
+    Returns:
+        StorageTree: The storage tree.
+    """
+    if 'storage_tree' in g:
+        return g.storage_tree
+
+    version = get_data_version(STORAGE_VERSION)
+    with _tree_cache_lock:
+        cached = _tree_cache.get('tree')
+    if cached and cached[0] == version:
+        tree = cached[1]
+    else:
+        tree = load_storage_tree()
+        with _tree_cache_lock:
+            _tree_cache['tree'] = (version, tree)
+
+    g.storage_tree = tree
+    return tree
@@ -2,7 +2,9 @@
     It defines the User model for storing user information and authentication.
 """
 
+from typing import FrozenSet
 from app import db
+from app.resource.auth.permission import get_user_permissions
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -16,7 +18,7 @@ class User(UserMixin, db.Model):
     first_name = db.Column(db.String(64), nullable=True)
     last_name = db.Column(db.String(64), nullable=True)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
-    image_filename = db.Column(db.String(256), nullable=True)  # For user profile image
+    image_filename = db.Column(db.String(256), nullable=True, index=True)  # For user profile image
 
     def set_password(self, password) -> None:
         """ Set the user's password by hashing it. 
@@ -40,10 +42,19 @@ class User(UserMixin, db.Model):
         """
         return check_password_hash(self.password_hash, password)
 
+    def get_permissions(self) -> FrozenSet[str]:
+        """ Get the names of all permissions the user has through its groups and their roles.
+        The permissions are cached, see `app.resource.auth.permission`.
+
+        Returns:
+            FrozenSet[str]: The names of the permissions of the user.
+        """
+        return get_user_permissions(self.id)
+
     def has_permission(self, permission_name: str) -> bool:
         """ Check if the user has a specific permission.
         This method checks if the user belongs to any group that has the specified permission.
-        This is done by iterating through the user's groups and their roles to find the permission.
+        This is done by a lookup in the cached set of the user's permissions.
 
         Args:
             permission_name (str): The name of the permission to check.
@@ -51,8 +62,4 @@ class User(UserMixin, db.Model):
         Returns:
             bool: True if the user has the permission, False otherwise.
         """
-        for group in self.groups:
-            for role in group.roles:
-                if any(permission.name == permission_name for permission in role.permissions):
-                    return True
-        return False
+        return permission_name in self.get_permissions()
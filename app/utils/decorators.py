@@ -6,6 +6,7 @@ from flask import redirect, url_for, abort
 from flask_login import current_user
 from functools import wraps
 from app.resource.auth.model import Group, Role, Permission
+from app.utils.replica import use_primary_database
 
 def anonymous_required(f) -> callable:
     """ Decorator to restrict access to anonymous users only.
@@ -21,6 +22,21 @@ def anonymous_required(f) -> callable:
     return decorated_function
 
 
+def primary_db(f) -> callable:
+    """ Decorator to run all queries of a route on the primary database instead of the read replica.
+    GET routes read from the replica in read-only transactions, routes which change data with a GET request
+    have to be marked, so they can write and do not read stale rows before their changes.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        """ Pin the request to the primary database. """
+        use_primary_database()
+        return f(*args, **kwargs)
+    # checked before the request, so the read-only mode is not started for the route
+    decorated_function.primary_db = True
+    return decorated_function
+
+
 def check_permissions(required_permissions: List[str]) -> callable:
     """Decorator to check if the user has the required permissions.
     This decorator can be applied to Flask route functions to ensure that the user has the necessary permissions
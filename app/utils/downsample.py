@@ -0,0 +1,57 @@
+""" Downsampling of time series for charts.
+    Largest-Triangle-Three-Buckets (LTTB) keeps the points which shape the visible line,
+    so peaks and drops survive while the number of points is bounded.
+"""
+
+from typing import List, Sequence, Tuple
+
+
+Point = Tuple[float, float]
+
+
+def lttb(points: Sequence[Point], threshold: int) -> List[Point]:
+    """ Downsample a series with the Largest-Triangle-Three-Buckets algorithm.
+    The first and the last point are always kept.
+
+    Args:
+        points (Sequence[Point]): The (x, y) points, sorted by x.
+        threshold (int): The maximum number of points to return.
+
+    Returns:
+        list: At most `threshold` points of the series, sorted by x.
+    """
+    length = len(points)
+    if threshold >= length:
+        return list(points)
+    if threshold < 3:
+        return [points[0], points[-1]][:max(threshold, 0)]
+
+    sampled = [points[0]]
+    # the points between the first and the last are split into threshold - 2 buckets
+    bucket_size = (length - 2) / (threshold - 2)
+    selected = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # the third vertex of the triangle is the average of the next bucket
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, length)
+        next_points = points[next_start:next_end] or points[-1:]
+        average_x = sum(point[0] for point in next_points) / len(next_points)
+        average_y = sum(point[1] for point in next_points) / len(next_points)
+
+        selected_x, selected_y = points[selected]
+        largest_area = -1.0
+        largest = start
+        for index in range(start, end):
+            x, y = points[index]
+            area = abs((selected_x - average_x) * (y - selected_y) - (selected_x - x) * (average_y - selected_y))
+            if area > largest_area:
+                largest_area = area
+                largest = index
+        sampled.append(points[largest])
+        selected = largest
+
+    sampled.append(points[-1])
+    return sampled
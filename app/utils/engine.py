@@ -0,0 +1,188 @@
+""" Engine profiles of the database connections.
+    The profile of a database is selected by its URL, or for all databases with `DATABASE_PROFILE`:
+
+    + sqlite: Write-ahead logging, so readers do not wait for a writer and a writer does not wait for readers,
+      `synchronous=NORMAL`, which is safe with WAL, a larger page cache, memory mapped reads,
+      a busy timeout instead of immediate `database is locked` errors and enforced foreign keys.
+      The pragmas are set on every new connection.
+    + server: A connection pool of a fixed size with overflow, connections are checked before use
+      and recycled before the server closes them.
+    + none: The defaults of SQLAlchemy.
+
+    A SQLite read replica is opened without write-ahead logging and with `query_only`,
+    its connections are replaced when a snapshot has replaced the file.
+"""
+
+import os
+from flask import Flask
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+
+
+ENGINE_PROFILES = ('auto', 'sqlite', 'server', 'none')
+
+
+def get_engine_profile(url, config: dict) -> str:
+    """ Get the engine profile of a database.
+
+    Args:
+        url (str): The URL of the database.
+        config (dict): The configuration of the application.
+
+    Raises:
+        ValueError: If `DATABASE_PROFILE` is unknown.
+
+    Returns:
+        str: One of sqlite, server or none.
+    """
+    profile = config.get('DATABASE_PROFILE') or 'auto'
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown database profile {profile}")
+    if profile != 'auto':
+        return profile
+    return 'sqlite' if make_url(url).get_backend_name() == 'sqlite' else 'server'
+
+
+def _is_memory_database(url) -> bool:
+    """ Check if a SQLite URL points to an in-memory database, which cannot use write-ahead logging. """
+    database = make_url(url).database
+    return not database or database == ':memory:' or 'mode=memory' in str(url)
+
+
+def get_engine_options(url, config: dict) -> dict:
+    """ Get the engine options of the profile of a database.
+
+    Args:
+        url (str): The URL of the database.
+        config (dict): The configuration of the application.
+
+    Returns:
+        dict: The keyword arguments for `create_engine`.
+    """
+    profile = get_engine_profile(url, config)
+    if profile == 'server':
+        return {
+            'pool_size': config.get('DATABASE_POOL_SIZE', 10),
+            'max_overflow': config.get('DATABASE_MAX_OVERFLOW', 20),
+            'pool_timeout': config.get('DATABASE_POOL_TIMEOUT', 30),
+            'pool_recycle': config.get('DATABASE_POOL_RECYCLE', 1800),
+            'pool_pre_ping': True,
+        }
+    if profile == 'sqlite':
+        # the driver waits for locks as well, in seconds
+        return {'connect_args': {'timeout': config.get('SQLITE_BUSY_TIMEOUT', 5000) / 1000}}
+    return {}
+
+
+def configure_engine_profiles(config: dict) -> None:
+    """ Add the engine options of the profiles to the configuration, before the database extension is initialized.
+    Options which are set in the configuration take precedence over the options of the profile.
+
+    Args:
+        config (dict): The configuration of the application.
+
+    Returns:
+        None
+    """
+    uri = config.get('SQLALCHEMY_DATABASE_URI')
+    if uri:
+        options = get_engine_options(uri, config)
+        options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+    for key, value in binds.items():
+        bind = {'url': value} if isinstance(value, str) else dict(value)
+        options = get_engine_options(bind['url'], config)
+        options.update(bind)
+        binds[key] = options
+    config['SQLALCHEMY_BINDS'] = binds
+
+
+SQLITE_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def set_sqlite_pragmas(dbapi_connection, config: dict, wal: bool = True, read_only: bool = False) -> None:
+    """ Set the pragmas of the sqlite profile on a new connection.
+    The pragmas are executed with the driver outside of a transaction, `journal_mode` cannot be changed in one.
+
+    Args:
+        dbapi_connection: The connection of the driver.
+        config (dict): The configuration of the application.
+        wal (bool): Switch to write-ahead logging, which in-memory databases do not support.
+        read_only (bool): Reject writes on the connection.
+
+    Raises:
+        ValueError: If `SQLITE_SYNCHRONOUS` is unknown.
+
+    Returns:
+        None
+    """
+    synchronous = str(config.get('SQLITE_SYNCHRONOUS', 'NORMAL')).upper()
+    if synchronous not in SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError(f"Unknown SQLite synchronous mode {synchronous}")
+    cursor = dbapi_connection.cursor()
+    try:
+        if wal:
+            cursor.execute('PRAGMA journal_mode = WAL')
+        cursor.execute(f'PRAGMA synchronous = {synchronous}')
+        cursor.execute(f"PRAGMA busy_timeout = {int(config.get('SQLITE_BUSY_TIMEOUT', 5000))}")
+        # a negative cache size is in KiB instead of pages
+        cursor.execute(f"PRAGMA cache_size = -{int(config.get('SQLITE_CACHE_SIZE_KIB', 65536))}")
+        cursor.execute(f"PRAGMA mmap_size = {int(config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}")
+        cursor.execute(f"PRAGMA foreign_keys = {'ON' if config.get('SQLITE_FOREIGN_KEYS', True) else 'OFF'}")
+        if read_only:
+            cursor.execute('PRAGMA query_only = ON')
+    finally:
+        cursor.close()
+
+
+def init_engine_profiles(app: Flask) -> None:
+    """ Register the connection hooks of the profiles on the engines of the application.
+
+    Args:
+        app (Flask): The application with the initialized database extension.
+
+    Returns:
+        None
+    """
+    from app import db
+    from app.utils.replica import REPLICA_BIND
+
+    with app.app_context():
+        engines = dict(db.engines)
+    for key, engine in engines.items():
+        _register_profile_hooks(engine, app.config, read_only=key == REPLICA_BIND)
+
+
+def _register_profile_hooks(engine: Engine, config: dict, read_only: bool = False) -> None:
+    """ Register the connection hooks of the profile of an engine. """
+    if engine.dialect.name != 'sqlite' or get_engine_profile(engine.url, config) != 'sqlite':
+        return
+    settings = {
+        key: config[key] for key in (
+            'SQLITE_SYNCHRONOUS', 'SQLITE_BUSY_TIMEOUT', 'SQLITE_CACHE_SIZE_KIB', 'SQLITE_MMAP_SIZE',
+            'SQLITE_FOREIGN_KEYS'
+        ) if key in config
+    }
+    wal = not _is_memory_database(engine.url) and not read_only
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        set_sqlite_pragmas(dbapi_connection, settings, wal, read_only)
+
+    if not read_only or _is_memory_database(engine.url):
+        return
+    from app.utils.replica import sqlite_database_path
+    path = sqlite_database_path(engine.url)
+
+    @event.listens_for(engine, 'connect')
+    def remember_file(dbapi_connection, connection_record):
+        connection_record.info['inode'] = os.stat(path).st_ino if os.path.exists(path) else None
+
+    @event.listens_for(engine, 'checkout')
+    def check_file(dbapi_connection, connection_record, connection_proxy):
+        # a connection keeps reading the replaced file, the pool opens a new connection instead
+        inode = os.stat(path).st_ino if os.path.exists(path) else None
+        if connection_record.info.get('inode') != inode:
+            raise exc.DisconnectionError("The replica was replaced by a snapshot")
@@ -1,5 +1,16 @@
 """ Utility functions for handling images """
 
+import re
+
+
+# Uploaded images are stored under the SHA-256 digest of their content, older uploads under a uuid4 name.
+# Both are never overwritten with another content.
+IMMUTABLE_IMAGE_NAME = re.compile(
+    r'^([0-9a-f]{64}|[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12})\.[A-Za-z0-9]+$'
+)
+# Name of an image in the content-addressed store, relative to the directory of its kind
+BLOB_IMAGE_NAME = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[A-Za-z0-9]+$')
+
 
 def is_image_name_valid(image_name):
     """ Check if the image name is not None and not an empty string.
@@ -19,4 +30,54 @@ def get_default_user_image():
     Returns:
         str: The filename of the default user image.
     """
-    return "default_user_image.png"
\ No newline at end of file
+    return "default_user_image.png"
+
+
+def is_immutable_image_name(image_name):
+    """ Check if the image name belongs to an uploaded image, whose content never changes.
+
+    Args:
+        image_name (str): The name or relative path of the image file.
+
+    Returns:
+        bool: True if the image name is the name of an uploaded image, False otherwise.
+    """
+    return IMMUTABLE_IMAGE_NAME.match(image_name.rsplit('/', 1)[-1]) is not None
+
+
+def get_blob_name(digest, extension):
+    """ Get the name of an image in the content-addressed store.
+    The first two byte pairs of the digest are subdirectories, so no directory holds too many files.
+
+    Args:
+        digest (str): The SHA-256 hex digest of the content.
+        extension (str): The file extension including the dot, e.g. '.jpg'.
+
+    Returns:
+        str: The name of the image relative to the directory of its kind, e.g. 'ab/cd/abcd....jpg'.
+    """
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def is_blob_image_name(image_name):
+    """ Check if the image name belongs to the content-addressed store.
+
+    Args:
+        image_name (str): The name of the image file.
+
+    Returns:
+        bool: True if the image is stored by its content hash, False for default images and older uploads.
+    """
+    return image_name is not None and BLOB_IMAGE_NAME.match(image_name) is not None
+
+
+def is_default_image_name(image_name):
+    """ Check if the image name belongs to one of the default images, which are never deleted.
+
+    Args:
+        image_name (str): The name of the image file.
+
+    Returns:
+        bool: True if the image is a default image.
+    """
+    return image_name is not None and '/' not in image_name and image_name.startswith('default_')
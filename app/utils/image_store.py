@@ -0,0 +1,309 @@
+""" Reference counting of the stored images.
+    An image file can be referenced by several rows, e.g. the same photo of several items.
+    A file is only deleted once no row references it anymore, the references are counted by query.
+    Files which are left without a row, e.g. after a failed request, are found by the garbage collector.
+    It moves them into a quarantine directory first and deletes them after a grace period.
+"""
+
+import hashlib
+import os
+import time
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+from flask import current_app
+from app import db
+from app.utils.image import get_blob_name, is_blob_image_name, is_default_image_name
+from app.utils.upload import CHUNK_SIZE, detect_image_extension, get_image_directory
+
+
+IMAGE_KINDS = ('item', 'storage', 'user')
+QUARANTINE_DIR = os.path.join('img', '.quarantine')
+
+
+def get_image_references(kind: str) -> list:
+    """ Get the columns which reference the images of a kind.
+
+    Args:
+        kind (str): The image kind, one of item, user or storage.
+
+    Returns:
+        list: The columns holding the image names.
+    """
+    from app.resource.item.model import ItemImage
+    from app.resource.storage_location.model import StorageLocationImage
+    from app.user.model import User
+    return {
+        'item': [ItemImage.filename],
+        'storage': [StorageLocationImage.filename],
+        'user': [User.image_filename],
+    }[kind]
+
+
+def count_image_references(kind: str, filename: str) -> int:
+    """ Count the rows which reference an image.
+
+    Args:
+        kind (str): The image kind, one of item, user or storage.
+        filename (str): The name of the image.
+
+    Returns:
+        int: The number of referencing rows.
+    """
+    return sum(
+        db.session.execute(
+            db.select(db.func.count()).where(column == filename)
+        ).scalar_one()
+        for column in get_image_references(kind)
+    )
+
+
+def get_image_path(kind: str, filename: str) -> str:
+    """ Get the path of an image file.
+
+    Args:
+        kind (str): The image kind, one of item, user or storage.
+        filename (str): The name of the image, relative to the directory of its kind.
+
+    Returns:
+        str: The path of the image file.
+    """
+    return os.path.join(get_image_directory(kind), *filename.split('/'))
+
+
+def release_images(kind: str, filenames: Iterable[str], min_age: Optional[float] = None) -> int:
+    """ Delete the image files which are no longer referenced.
+    Call it after the rows which referenced the images were deleted and committed.
+    A file younger than `min_age` is kept, an upload of the same content may not have committed its reference yet.
+    The garbage collector removes such a file later if it stays unreferenced.
+
+    Args:
+        kind (str): The image kind, one of item, user or storage.
+        filenames (Iterable[str]): The names of the images which lost a reference.
+        min_age (float): The minimum age of a deleted file in seconds. Defaults to `IMAGE_GC_MIN_AGE`.
+
+    Returns:
+        int: The number of deleted files.
+    """
+    if min_age is None:
+        min_age = current_app.config.get('IMAGE_GC_MIN_AGE', 3600)
+    threshold = time.time() - min_age
+    deleted = 0
+    for filename in set(filenames):
+        if not filename or is_default_image_name(filename):
+            continue
+        path = get_image_path(kind, filename)
+        try:
+            if os.stat(path).st_mtime > threshold:
+                continue
+        except FileNotFoundError:
+            continue
+        # checked right before the file is removed, the reference of a new upload may have been committed
+        if count_image_references(kind, filename) > 0:
+            continue
+        try:
+            os.remove(path)
+            deleted += 1
+        except FileNotFoundError:
+            continue
+        _remove_empty_shards(kind, path)
+    return deleted
+
+
+def _remove_empty_shards(kind: str, path: str) -> None:
+    """ Remove the shard directories of a deleted image if they are empty. """
+    root = os.path.abspath(get_image_directory(kind))
+    directory = os.path.dirname(os.path.abspath(path))
+    while directory != root and directory.startswith(root):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
+
+
+def migrate_to_image_store() -> int:
+    """ Move the images stored under a uuid name into the content-addressed store.
+    Files with the same content are stored once and the rows are updated to the new names.
+    The function can be repeated, images which are already in the store are skipped.
+
+    Returns:
+        int: The number of moved files.
+    """
+    moved = 0
+    for kind in IMAGE_KINDS:
+        columns = get_image_references(kind)
+        filenames = set()
+        for column in columns:
+            filenames.update(db.session.execute(db.select(column).distinct()).scalars())
+
+        for filename in filenames:
+            if not filename or is_default_image_name(filename) or is_blob_image_name(filename):
+                continue
+            path = get_image_path(kind, filename)
+            if not os.path.isfile(path):
+                continue
+
+            digest = hashlib.sha256()
+            with open(path, 'rb') as image:
+                head = image.read(16)
+                image.seek(0)
+                for chunk in iter(lambda: image.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            extension = detect_image_extension(head) or os.path.splitext(filename)[1].lower()
+
+            blob_name = get_blob_name(digest.hexdigest(), extension)
+            blob_path = get_image_path(kind, blob_name)
+            if os.path.exists(blob_path):
+                os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(path, blob_path)
+            for column in columns:
+                db.session.execute(
+                    db.update(column.class_).where(column == filename).values({column.key: blob_name})
+                )
+            # Commit per file, the file was already moved
+            db.session.commit()
+            moved += 1
+    return moved
+
+
+def iter_image_files(directory: str) -> Iterator[Tuple[str, float]]:
+    """ Iterate over all files below a directory without listing it at once.
+
+    Args:
+        directory (str): The directory to scan.
+
+    Returns:
+        Iterator: The names relative to the directory, with '/' as separator, and the modification times.
+    """
+    pending = ['']
+    while pending:
+        relative = pending.pop()
+        try:
+            with os.scandir(os.path.join(directory, *relative.split('/')) if relative else directory) as entries:
+                for entry in entries:
+                    name = f"{relative}/{entry.name}" if relative else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(name)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield name, entry.stat(follow_symlinks=False).st_mtime
+        except FileNotFoundError:
+            continue
+
+
+def _batches(iterator: Iterable, size: int) -> Iterator[list]:
+    """ Split an iterator into lists of at most `size` elements. """
+    batch = []
+    for element in iterator:
+        batch.append(element)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def get_referenced_images(kind: str, filenames: List[str]) -> Set[str]:
+    """ Get the image names of a batch which are referenced by at least one row.
+
+    Args:
+        kind (str): The image kind, one of item, user or storage.
+        filenames (list): The image names to check.
+
+    Returns:
+        set: The referenced image names.
+    """
+    referenced = set()
+    for column in get_image_references(kind):
+        referenced.update(db.session.execute(
+            db.select(column).where(column.in_(filenames)).distinct()
+        ).scalars())
+    return referenced
+
+
+def find_orphan_images(kind: str, min_age: float, batch_size: int = 500) -> Iterator[str]:
+    """ Find the image files of a kind which no row references.
+    The directory is streamed and checked in batches, so its size does not matter.
+    Files younger than `min_age` are skipped, their rows may not be committed yet.
+
+    Args:
+        kind (str): The image kind, one of item, user or storage.
+        min_age (float): The minimum age of an orphan in seconds.
+        batch_size (int): The number of files checked with one query.
+
+    Returns:
+        Iterator: The names of the orphaned files, relative to the directory of the kind.
+    """
+    threshold = time.time() - min_age
+    files = (
+        name for name, mtime in iter_image_files(get_image_directory(kind))
+        if mtime <= threshold and not is_default_image_name(name)
+    )
+    for batch in _batches(files, batch_size):
+        referenced = get_referenced_images(kind, batch)
+        for name in batch:
+            if name not in referenced:
+                yield name
+
+
+def quarantine_orphan_images(kind: str, min_age: float, batch_size: int = 500, dry_run: bool = False) -> int:
+    """ Move the orphaned image files of a kind into the quarantine directory.
+    The modification time of a quarantined file is the time it was quarantined.
+
+    Args:
+        kind (str): The image kind, one of item, user or storage.
+        min_age (float): The minimum age of an orphan in seconds.
+        batch_size (int): The number of files checked with one query.
+        dry_run (bool): Only count the orphans.
+
+    Returns:
+        int: The number of quarantined files.
+    """
+    count = 0
+    for name in find_orphan_images(kind, min_age, batch_size):
+        count += 1
+        if dry_run:
+            continue
+        target = os.path.join(QUARANTINE_DIR, kind, *name.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.replace(get_image_path(kind, name), target)
+        except FileNotFoundError:
+            count -= 1
+            continue
+        os.utime(target)
+        _remove_empty_shards(kind, get_image_path(kind, name))
+    return count
+
+
+def purge_quarantined_images(kind: str, grace_period: float, batch_size: int = 500, dry_run: bool = False) -> Tuple[int, int]:
+    """ Restore the quarantined files of a kind which are referenced again and delete the others after their grace period.
+    Every quarantined file is checked on every run, so a referenced file is restored at once.
+
+    Args:
+        kind (str): The image kind, one of item, user or storage.
+        grace_period (float): The time in seconds a file stays in quarantine.
+        batch_size (int): The number of files checked with one query.
+        dry_run (bool): Only count the files.
+
+    Returns:
+        tuple: The number of deleted and of restored files.
+    """
+    directory = os.path.join(QUARANTINE_DIR, kind)
+    threshold = time.time() - grace_period
+    deleted = restored = 0
+    for batch in _batches(iter_image_files(directory), batch_size):
+        referenced = get_referenced_images(kind, [name for name, _ in batch])
+        for name, mtime in batch:
+            path = os.path.join(directory, *name.split('/'))
+            if name in referenced:
+                restored += 1
+                if not dry_run:
+                    target = get_image_path(kind, name)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(path, target)
+            elif mtime <= threshold:
+                deleted += 1
+                if not dry_run:
+                    os.remove(path)
+    return deleted, restored
@@ -0,0 +1,144 @@
+""" Background jobs of the web application.
+    A job runs in its own thread with an application context and reports its progress,
+    so a long running operation does not block the request which started it.
+    The jobs are kept in memory of the process, their progress can be read by their ID.
+    Only the process which started a job knows it, the progress therefore requires a single worker process:
+    with several worker processes a progress request can reach another worker and finds no job,
+    clients treat this as an unknown state, not as a failure.
+    A job is lost when its process stops, the operation has to be repeatable, e.g. `flask storage delete`
+    finishes an interrupted deletion of a storage location.
+"""
+
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Optional
+from uuid import uuid4
+from flask import current_app
+
+
+# Seconds a finished job is kept for progress requests
+FINISHED_JOB_TTL = 3600
+
+_jobs: Dict[str, 'Job'] = {}
+_jobs_lock = threading.Lock()
+
+
+class Job:
+    """ A background job and its progress.
+
+    Attributes:
+        id (str): Unique identifier of the job.
+        name (str): Name of the job, e.g. 'delete_storage'.
+        user_id (int): ID of the user who started the job.
+        status (str): One of pending, running, done or failed.
+        done (int): Number of processed units.
+        total (int): Number of units to process, 0 if unknown.
+        message (str): The current step.
+        result (object): The return value of the job function.
+        error (str): The error message if the job failed.
+    """
+
+    def __init__(self, name: str, user_id: Optional[int] = None):
+        self.id = uuid4().hex
+        self.name = name
+        self.user_id = user_id
+        self.status = 'pending'
+        self.done = 0
+        self.total = 0
+        self.message = None
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+    def __repr__(self):
+        return f"<Job {self.name} {self.id} {self.status} {self.done}/{self.total}>"
+
+    def update(self, done: Optional[int] = None, total: Optional[int] = None, message: Optional[str] = None) -> None:
+        """ Report the progress of the job.
+
+        Args:
+            done (int): Number of processed units.
+            total (int): Number of units to process.
+            message (str): The current step.
+
+        Returns:
+            None
+        """
+        if total is not None:
+            self.total = total
+        if done is not None:
+            self.done = done
+        if message is not None:
+            self.message = message
+
+    def to_dict(self) -> dict:
+        """ Get the progress of the job for a JSON response.
+
+        Returns:
+            dict: The state of the job.
+        """
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'done': self.done,
+            'total': self.total,
+            'message': self.message,
+            'error': self.error,
+        }
+
+
+def start_job(name: str, function: Callable, *args, user_id: Optional[int] = None, **kwargs) -> Job:
+    """ Run a function as a background job.
+    The function is called with the job as first argument inside an application context.
+
+    Args:
+        name (str): Name of the job.
+        function (Callable): The function to run.
+        user_id (int): ID of the user who started the job.
+
+    Returns:
+        Job: The started job.
+    """
+    app = current_app._get_current_object()
+    job = Job(name, user_id)
+
+    def run():
+        with app.app_context():
+            job.status = 'running'
+            try:
+                job.result = function(job, *args, **kwargs)
+                job.status = 'done'
+            except Exception as exception:
+                app.logger.error(f"Job {job.name} {job.id} failed:\n{traceback.format_exc()}")
+                job.error = str(exception)
+                job.status = 'failed'
+            finally:
+                job.finished_at = time.time()
+
+    with _jobs_lock:
+        _remove_finished_jobs()
+        _jobs[job.id] = job
+    threading.Thread(target=run, name=f"job-{name}", daemon=True).start()
+    return job
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    """ Get a job by its ID.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        Job: The job, None if it does not exist or expired.
+    """
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def _remove_finished_jobs() -> None:
+    """ Forget the jobs which finished more than `FINISHED_JOB_TTL` seconds ago. """
+    threshold = time.time() - FINISHED_JOB_TTL
+    for job_id in [job_id for job_id, job in _jobs.items() if job.finished_at and job.finished_at < threshold]:
+        del _jobs[job_id]
@@ -0,0 +1,112 @@
+""" Eager-loading profiles for list views.
+    A profile is a named set of loader options, which loads all relationships a template reads
+    together with the listed objects. The number of queries per page then no longer depends on the number of rows.
+    In debug mode every lazy load while rendering a template of a view which applied a profile raises an AssertionError.
+"""
+
+from typing import List
+from flask import Flask, current_app, g, before_render_template, template_rendered, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, selectinload
+from app import db
+from app.resource.category.model import Category
+from app.resource.item.model import Item
+from app.resource.storage_location.model import StorageLocation
+
+
+# The options are built on use, backref relationships like `Item.images` exist only once the mappers are configured.
+LOADER_PROFILES = {
+    # site.catalog.html: first image, storage location and owner of every item
+    'catalog': lambda: [
+        selectinload(Item.images),
+        joinedload(Item.storage_location),
+        joinedload(Item.owner),
+    ],
+    # site.search.result.html: images and category badges of every item
+    'search_items': lambda: [
+        selectinload(Item.images),
+        selectinload(Item.categories).joinedload(Category.color),
+    ],
+    # site.search.result.html: images and category badges of every storage location
+    'search_storages': lambda: [
+        selectinload(StorageLocation.images),
+        selectinload(StorageLocation.categories).joinedload(Category.color),
+    ],
+    # category badges of forms and filters
+    'categories': lambda: [
+        joinedload(Category.color),
+    ],
+}
+
+
+def get_loader_options(profile: str) -> List:
+    """ Get the loader options of a profile and mark the current request as using it.
+
+    Args:
+        profile (str): The name of the profile, one of `LOADER_PROFILES`.
+
+    Returns:
+        list: The loader options, to be passed to `options()` of the query.
+    """
+    if has_request_context():
+        g.setdefault('loader_profiles', set()).add(profile)
+    return LOADER_PROFILES[profile]()
+
+
+def is_lazy_load_check_enabled() -> bool:
+    """ Check if lazy loads while rendering templates should raise.
+    The check follows the debug mode, unless `ASSERT_NO_LAZY_LOADS` is set.
+
+    Returns:
+        bool: True if the check is enabled.
+    """
+    enabled = current_app.config.get('ASSERT_NO_LAZY_LOADS')
+    return current_app.debug if enabled is None else enabled
+
+
+def _start_rendering(sender, template, context, **extra) -> None:
+    """ Mark the request as rendering a template. """
+    g.rendering_template = template.name
+
+
+def _stop_rendering(sender, template, context, **extra) -> None:
+    """ Mark the request as no longer rendering a template. """
+    g.pop('rendering_template', None)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def assert_no_lazy_load(orm_execute_state) -> None:
+    """ Raise if a relationship is lazy loaded while a template of a view with a loader profile is rendered.
+
+    Args:
+        orm_execute_state (ORMExecuteState): The state of the ORM statement execution.
+
+    Raises:
+        AssertionError: If the statement is a lazy load during template rendering.
+
+    Returns:
+        None
+    """
+    if not orm_execute_state.is_relationship_load or not has_request_context():
+        return
+    if 'rendering_template' not in g or not g.get('loader_profiles'):
+        return
+    if not is_lazy_load_check_enabled():
+        return
+    raise AssertionError(
+        f"Lazy load of {orm_execute_state.loader_strategy_path} while rendering {g.rendering_template} "
+        f"with the loader profiles {sorted(g.loader_profiles)}. Add the relationship to the profile."
+    )
+
+
+def init_lazy_load_check(app: Flask) -> None:
+    """ Track template rendering of the application for the lazy load check.
+
+    Args:
+        app (Flask): The application.
+
+    Returns:
+        None
+    """
+    before_render_template.connect(_start_rendering, app)
+    template_rendered.connect(_stop_rendering, app)
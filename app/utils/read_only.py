@@ -0,0 +1,90 @@
+""" Read-only mode for the database session of GET requests.
+    Every GET request runs in read-only mode, except routes which change data and are marked with `primary_db`.
+    A request in read-only mode runs without autoflush, there are no pending changes to flush before its queries,
+    and its transactions are read-only: SQLite connections get `query_only`, other databases a `READ ONLY` transaction.
+    A write raises an error of the database instead of changing data.
+    The mode of a connection is reset when it is returned to the pool.
+    List views should also select the columns their template shows instead of whole objects,
+    rows are neither tracked in the identity map nor expired.
+"""
+
+from flask import Flask, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.utils.replica import READ_METHODS, REPLICA_BIND
+
+
+def start_read_only_request() -> None:
+    """ Switch the current GET request to read-only mode.
+    Transactions which are already open keep their mode, so the mode is set before the first query of the view.
+
+    Returns:
+        None
+    """
+    from app import db
+
+    if has_request_context() and request.method in READ_METHODS:
+        g.db_read_only = True
+        db.session.autoflush = False
+
+
+def is_read_only_request() -> bool:
+    """ Check if the current request is in read-only mode.
+
+    Returns:
+        bool: True if the transactions of the request are read-only.
+    """
+    return has_request_context() and bool(g.get('db_read_only'))
+
+
+def init_read_only_transactions(app: Flask) -> None:
+    """ Register the hooks which start the read-only mode of GET requests and the transaction hooks on the engines.
+    The replica is read-only on its own and is skipped.
+
+    Args:
+        app (Flask): The application with the initialized database extension.
+
+    Returns:
+        None
+    """
+    from app import db
+
+    @app.before_request
+    def start_read_only_mode():
+        """ Switch GET requests to read-only mode, unless their route is marked with `primary_db`. """
+        view = app.view_functions.get(request.endpoint)
+        if not getattr(view, 'primary_db', False):
+            start_read_only_request()
+
+    with app.app_context():
+        engines = dict(db.engines)
+    for key, engine in engines.items():
+        if key != REPLICA_BIND:
+            _register_read_only_hooks(engine)
+
+
+def _register_read_only_hooks(engine: Engine) -> None:
+    """ Register the hooks which start read-only transactions and reset the connections of an engine. """
+    sqlite = engine.dialect.name == 'sqlite'
+
+    @event.listens_for(engine, 'begin')
+    def begin_read_only(connection):
+        if not is_read_only_request():
+            return
+        if sqlite:
+            connection.exec_driver_sql('PRAGMA query_only = ON')
+        else:
+            # applies to the transaction which the driver begins with the next statement
+            connection.exec_driver_sql('SET TRANSACTION READ ONLY')
+        connection.info['read_only'] = True
+
+    @event.listens_for(engine, 'checkin')
+    def reset_read_only(dbapi_connection, connection_record):
+        # a read-only transaction ends with its rollback on checkin, only the pragma outlives it
+        if not connection_record.info.pop('read_only', False) or dbapi_connection is None or not sqlite:
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute('PRAGMA query_only = OFF')
+        finally:
+            cursor.close()
@@ -0,0 +1,169 @@
+""" Routing of reads to a read replica of the database.
+    The replica is the bind `replica` of `SQLALCHEMY_BINDS`, it is configured with `DATABASE_REPLICA_URL`.
+    It can be a database server replica or a copy of a SQLite database which is refreshed by a snapshot.
+
+    Queries of GET requests run on the replica. Everything else stays on the primary database:
+    other request methods, commands and background jobs, every flush or data manipulation statement and,
+    once a request has written, all later queries of that request (read-your-writes).
+    After a request that wrote, the client reads from the primary for `DATABASE_REPLICA_STICKY_SECONDS`,
+    so a redirect after a change shows the change although the replica lags behind.
+    GET routes which change data are marked with the decorator `primary_db`.
+    The user loader and the permission checks always read from the primary, so revoked access takes effect at once.
+"""
+
+import os
+import sqlite3
+import time
+from typing import Optional
+from flask import Flask, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+
+REPLICA_BIND = 'replica'
+READ_METHODS = ('GET', 'HEAD')
+PRIMARY_COOKIE = 'db_primary_until'
+
+
+def sqlite_database_path(url) -> Optional[str]:
+    """ Get the file of a SQLite database URL.
+
+    Args:
+        url (str): The URL of the database.
+
+    Returns:
+        str: The path of the database file, None for in-memory databases.
+    """
+    database = make_url(url).database
+    if not database or database == ':memory:' or 'mode=memory' in str(url):
+        return None
+    if database.startswith('file:'):
+        database = database[len('file:'):]
+    return database.split('?', 1)[0]
+
+
+def use_primary_database() -> None:
+    """ Route all following queries of the current request to the primary database.
+    The client keeps reading from the primary after the request, like after a write.
+
+    Returns:
+        None
+    """
+    if has_request_context():
+        g.db_primary = True
+
+
+def _is_pinned_to_primary() -> bool:
+    """ Check if the current request has written or the client wrote shortly before. """
+    if g.get('db_primary'):
+        return True
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def _is_replica_available(engine: Engine) -> bool:
+    """ Check if the replica can be read, a SQLite replica exists after the first snapshot. """
+    if engine.dialect.name != 'sqlite':
+        return True
+    path = sqlite_database_path(engine.url)
+    return path is None or os.path.exists(path)
+
+
+def get_replica_engine(engines: dict) -> Optional[Engine]:
+    """ Get the engine of the replica if the current query may read from it.
+
+    Args:
+        engines (dict): The engines of the application by bind key.
+
+    Returns:
+        Engine: The engine of the replica, None if the query has to run on the primary.
+    """
+    engine = engines.get(REPLICA_BIND)
+    if engine is None or not has_request_context() or request.method not in READ_METHODS:
+        return None
+    if _is_pinned_to_primary() or not _is_replica_available(engine):
+        return None
+    return engine
+
+
+class RoutingSession(Session):
+    """ A session which reads from the replica during GET requests and writes to the primary database. """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """ Select the replica for reads of GET requests, otherwise the engine of the bind key. """
+        if bind is None:
+            if getattr(clause, 'is_dml', False):
+                use_primary_database()
+            else:
+                engine = get_replica_engine(self._db.engines)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_replica(app: Flask) -> None:
+    """ Register the hooks which keep writes and the reads after them on the primary database.
+
+    Args:
+        app (Flask): The application with the initialized database extension.
+
+    Returns:
+        None
+    """
+    from app import db
+
+    @event.listens_for(db.session, 'before_flush')
+    def pin_flush_to_primary(session, flush_context, instances):
+        """ Run the flush and every later query of the request on the primary database. """
+        use_primary_database()
+
+    @app.after_request
+    def set_primary_cookie(response):
+        """ Let the client read from the primary until the replica has caught up with its writes. """
+        if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+            return response
+        if g.get('db_primary') or request.method not in READ_METHODS:
+            seconds = app.config.get('DATABASE_REPLICA_STICKY_SECONDS', 60)
+            response.set_cookie(
+                PRIMARY_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True, samesite='Lax'
+            )
+        return response
+
+
+def snapshot_sqlite_database(source: Engine, target_path: str) -> int:
+    """ Copy a SQLite database into a replica file with the online backup of SQLite.
+    The copy is written next to the replica and replaces it at once, readers of the replica never see a partial copy.
+    The backup is one read transaction, with write-ahead logging it does not block writers.
+
+    Args:
+        source (Engine): The engine of the primary database.
+        target_path (str): The file of the replica.
+
+    Raises:
+        ValueError: If the primary database is no SQLite file.
+
+    Returns:
+        int: The size of the replica in bytes.
+    """
+    if source.dialect.name != 'sqlite' or sqlite_database_path(source.url) is None:
+        raise ValueError("Snapshots require a SQLite database file")
+
+    temporary_path = f'{target_path}.snapshot'
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+    connection = source.raw_connection()
+    try:
+        target = sqlite3.connect(temporary_path)
+        try:
+            connection.driver_connection.backup(target)
+            # the replica is only read, it does not need the write-ahead log of the primary
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+    finally:
+        connection.close()
+    os.replace(temporary_path, target_path)
+    return os.path.getsize(target_path)
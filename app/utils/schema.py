@@ -0,0 +1,264 @@
+""" Utility functions for keeping the database schema of existing databases up to date.
+    `db.create_all()` only creates missing tables, changes of existing tables are made by migrations.
+    A migration is a revision with an upgrade function, the revisions are applied in order
+    and recorded in the table `schema_migration`, so every revision runs once per database.
+    The upgrade functions check the current schema first, a new database created from the models skips their changes.
+"""
+
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn, CreateTable
+from app import db
+
+
+schema_migration = db.Table(
+    'schema_migration',
+    db.Column('revision', db.String(100), primary_key=True),
+    db.Column('applied_at', db.DateTime, nullable=False),
+)
+
+
+def add_column(connection: Connection, table_name: str, column: db.Column) -> bool:
+    """ Add a column to an existing table if it is missing.
+    `db.create_all()` only creates missing tables, so new columns of existing tables
+    have to be added with `ALTER TABLE`. New columns must therefore be nullable or have a server default.
+
+    Args:
+        connection (Connection): The connection to use.
+        table_name (str): The name of the table.
+        column (Column): The column as it is added, independent of later changes of the model.
+
+    Returns:
+        bool: True if the column was added, False if the table does not exist or has the column already.
+    """
+    inspector = inspect(connection)
+    if not inspector.has_table(table_name):
+        return False
+    if column.name in {existing['name'] for existing in inspector.get_columns(table_name)}:
+        return False
+    column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+    connection.exec_driver_sql(f'ALTER TABLE {table_name} ADD COLUMN {column_ddl}')
+    return True
+
+
+def create_index(connection: Connection, name: str, table_name: str, column_names: List[str]) -> bool:
+    """ Create an index on an existing table if there is no index with its name.
+
+    Args:
+        connection (Connection): The connection to use.
+        name (str): The name of the index.
+        table_name (str): The name of the table.
+        column_names (list): The indexed columns in their order.
+
+    Returns:
+        bool: True if the index was created, False if the table does not exist or has the index already.
+    """
+    inspector = inspect(connection)
+    if not inspector.has_table(table_name):
+        return False
+    if name in {index['name'] for index in inspector.get_indexes(table_name)}:
+        return False
+    quote = connection.dialect.identifier_preparer.quote
+    columns = ', '.join(quote(column_name) for column_name in column_names)
+    connection.exec_driver_sql(f'CREATE INDEX {quote(name)} ON {quote(table_name)} ({columns})')
+    return True
+
+
+def _upgrade_existing_tables(connection: Connection) -> None:
+    """ Add the columns and indexes which older versions added on start, before there were migrations. """
+    add_column(connection, 'item', db.Column('current_quantity', db.Integer, nullable=True))
+    add_column(connection, 'item', db.Column('stock_updated_at', db.DateTime, nullable=True))
+    add_column(connection, 'storage_location', db.Column('path', db.String(512), nullable=True))
+    add_column(connection, 'storage_location', db.Column('depth', db.Integer, nullable=True))
+    create_index(connection, 'ix_item_name', 'item', ['name'])
+    create_index(connection, 'ix_item_current_quantity', 'item', ['current_quantity'])
+    create_index(connection, 'ix_item_stock_updated_at', 'item', ['stock_updated_at'])
+    create_index(connection, 'ix_item_image_filename', 'item_image', ['filename'])
+    create_index(connection, 'ix_storage_location_path', 'storage_location', ['path'])
+    create_index(connection, 'ix_storage_location_image_filename', 'storage_location_image', ['filename'])
+    create_index(connection, 'ix_users_image_filename', 'users', ['image_filename'])
+
+
+def _add_hot_path_indexes(connection: Connection) -> None:
+    """ Index the columns the item, stock and storage location queries filter and join on. """
+    create_index(connection, 'ix_item_owner_id', 'item', ['owner_id'])
+    create_index(connection, 'ix_item_storage_location_id', 'item', ['storage_location_id'])
+    create_index(connection, 'ix_item_image_item_id', 'item_image', ['item_id'])
+    create_index(connection, 'ix_item_storage_stock_item_id_timestamp', 'item_storage_stock', ['item_id', 'timestamp'])
+    create_index(connection, 'ix_storage_location_parent_id', 'storage_location', ['parent_id'])
+
+
+def _change_item_owner_id_to_integer(connection: Connection) -> None:
+    """ Change the type of `item.owner_id` from a string to an integer like `users.id`.
+    SQLite cannot change the type of a column, the table is rebuilt as described in the SQLite documentation:
+    the new table is created and filled, the old table is dropped and the new table is renamed.
+    """
+    columns = {column['name']: column for column in inspect(connection).get_columns('item')}
+    if isinstance(columns['owner_id']['type'], db.Integer):
+        return
+
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        connection.exec_driver_sql(
+            "ALTER TABLE item ALTER COLUMN owner_id TYPE INTEGER USING NULLIF(TRIM(owner_id), '')::integer"
+        )
+        return
+    if dialect != 'sqlite':
+        connection.exec_driver_sql("ALTER TABLE item MODIFY owner_id INTEGER NULL")
+        return
+
+    from app.resource.item.model import Item
+
+    # the other tables keep referencing the table by its name, so it can be replaced while foreign keys are off
+    foreign_keys = connection.exec_driver_sql('PRAGMA foreign_keys').scalar()
+    connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+    try:
+        # DDL is only part of a transaction if it is started explicitly
+        connection.exec_driver_sql('BEGIN')
+        table_ddl = str(CreateTable(Item.__table__).compile(dialect=connection.dialect))
+        connection.exec_driver_sql('DROP TABLE IF EXISTS item__new')
+        connection.exec_driver_sql(table_ddl.replace('CREATE TABLE item ', 'CREATE TABLE item__new ', 1))
+        names = [column.name for column in Item.__table__.columns if column.name in columns]
+        values = [
+            "NULLIF(CAST(NULLIF(TRIM(owner_id), '') AS INTEGER), 0)" if name == 'owner_id' else name
+            for name in names
+        ]
+        connection.exec_driver_sql(
+            f"INSERT INTO item__new ({', '.join(names)}) SELECT {', '.join(values)} FROM item"
+        )
+        connection.exec_driver_sql('DROP TABLE item')
+        connection.exec_driver_sql('ALTER TABLE item__new RENAME TO item')
+        for index in Item.__table__.indexes:
+            index.create(connection)
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.exec_driver_sql(f'PRAGMA foreign_keys = {"ON" if foreign_keys else "OFF"}')
+
+
+def _build_storage_paths(connection: Connection) -> None:
+    """ Build the materialized paths of storage locations which were created before the paths existed.
+    The catalog does not check for missing paths, it runs in a read-only transaction and could not build them.
+    """
+    from app.resource.storage_location.storage import ensure_storage_paths
+
+    ensure_storage_paths(connection)
+
+
+def _clear_invalid_item_references(connection: Connection) -> None:
+    """ Clear references of items which violate their foreign keys, SQLite enforces them since the engine profiles.
+    The item forms stored '' for items without storage location, deleted users left their ID as owner.
+    """
+    connection.exec_driver_sql(
+        "UPDATE item SET storage_location_id = NULL WHERE storage_location_id = '' "
+        "OR storage_location_id NOT IN (SELECT id FROM storage_location)"
+    )
+    connection.exec_driver_sql("UPDATE item SET owner_id = NULL WHERE owner_id NOT IN (SELECT id FROM users)")
+
+
+def _backfill_item_current_stock(connection: Connection) -> None:
+    """ Fill the current stock snapshot of items which were created before the snapshot existed. """
+    from app.resource.item.model import backfill_current_stock
+
+    backfill_current_stock(connection)
+
+
+def _create_data_version_rows(connection: Connection) -> None:
+    """ Create the rows of the data versions, so concurrent first changes do not insert the same row. """
+    from app.resource.auth.permission import PERMISSION_VERSION
+    from app.resource.category.model import CATEGORY_VERSION
+    from app.resource.dashboard.statistics import INVENTORY_VERSION
+    from app.resource.data_version.model import DataVersion
+    from app.resource.storage_location.model import STORAGE_VERSION
+
+    table = DataVersion.__table__
+    existing = set(connection.execute(db.select(table.c.name)).scalars())
+    rows = [
+        {'name': name, 'version': 0}
+        for name in (PERMISSION_VERSION, STORAGE_VERSION, INVENTORY_VERSION, CATEGORY_VERSION)
+        if name not in existing
+    ]
+    if rows:
+        connection.execute(db.insert(table), rows)
+
+
+# The revisions in the order they are applied, new revisions are appended
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ('0001_upgrade_existing_tables', _upgrade_existing_tables),
+    ('0002_hot_path_indexes', _add_hot_path_indexes),
+    ('0003_item_owner_id_integer', _change_item_owner_id_to_integer),
+    ('0004_storage_location_paths', _build_storage_paths),
+    ('0005_item_invalid_references', _clear_invalid_item_references),
+    ('0006_item_current_stock', _backfill_item_current_stock),
+    ('0007_data_version_rows', _create_data_version_rows),
+]
+
+
+def get_applied_migrations() -> List[str]:
+    """ Get the revisions which are applied to the database.
+
+    Returns:
+        List[str]: The applied revisions.
+    """
+    if not inspect(db.engine).has_table(schema_migration.name):
+        return []
+    with db.engine.connect() as connection:
+        return list(connection.execute(db.select(schema_migration.c.revision)).scalars())
+
+
+def get_foreign_key_violations() -> Dict[str, int]:
+    """ Check the rows of a SQLite database against their foreign keys with `PRAGMA foreign_key_check`.
+    Other databases enforce their foreign keys always and are not checked.
+
+    Returns:
+        dict: The number of rows with a violation by table.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return {}
+    violations: Dict[str, int] = {}
+    with db.engine.connect() as connection:
+        for row in connection.exec_driver_sql('PRAGMA foreign_key_check'):
+            violations[row[0]] = violations.get(row[0], 0) + 1
+    return violations
+
+
+def upgrade_schema() -> List[str]:
+    """ Create the missing tables and apply the pending migrations.
+    Every migration is recorded after it succeeded, a failed migration is repeated on the next upgrade.
+    SQLite databases are checked afterwards, rows which violate a foreign key could not be changed anymore
+    once the foreign keys are enforced.
+
+    Raises:
+        ValueError: If rows violate foreign keys and `SQLITE_FOREIGN_KEYS` enforces them.
+
+    Returns:
+        List[str]: The applied revisions.
+    """
+    db.create_all()
+    applied = set(get_applied_migrations())
+    upgraded = []
+    for revision, upgrade in MIGRATIONS:
+        if revision in applied:
+            continue
+        with db.engine.connect() as connection:
+            upgrade(connection)
+            connection.execute(db.insert(schema_migration).values(
+                revision=revision,
+                applied_at=datetime.now(timezone.utc).replace(tzinfo=None)
+            ))
+            connection.commit()
+        upgraded.append(revision)
+
+    if current_app.config.get('SQLITE_FOREIGN_KEYS', True):
+        violations = get_foreign_key_violations()
+        if violations:
+            tables = ', '.join(f'{table} ({count} rows)' for table, count in sorted(violations.items()))
+            raise ValueError(
+                f"Rows violate foreign keys: {tables}. Repair them or set SQLITE_FOREIGN_KEYS=false."
+            )
+    return upgraded
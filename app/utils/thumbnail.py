@@ -0,0 +1,207 @@
+""" Resized derivatives of the uploaded images.
+    Derivatives are created on the first request and stored in a cache directory below `img/`.
+    The cache is bounded by size, the least recently used derivatives are removed first.
+    Pillow is optional, without it the original images are served.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from typing import Optional, Tuple
+from flask import current_app
+
+
+CACHE_DIR = os.path.join('img', 'cache')
+
+# Pillow format names of the derivative formats
+DERIVATIVE_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+}
+
+_prune_lock = threading.Lock()
+# Estimated size of the cache in bytes, None until the cache directory was scanned by this process
+_cache_bytes = None
+
+
+def get_cache_dir() -> str:
+    """ Get the absolute path of the derivative cache directory.
+
+    Returns:
+        str: The path of the cache directory.
+    """
+    return os.path.join(os.getcwd(), CACHE_DIR)
+
+
+def get_resize_width(width: Optional[int]) -> Optional[int]:
+    """ Snap a requested width to the smallest allowed width that is not smaller.
+    Only a few widths are allowed, so a client cannot fill the cache with arbitrary sizes.
+
+    Args:
+        width (int): The requested width in pixels.
+
+    Returns:
+        int: The allowed width, None if no width was requested or it is larger than all allowed widths.
+    """
+    if not width or width <= 0:
+        return None
+    for allowed in sorted(current_app.config.get('IMAGE_RESIZE_WIDTHS', (100, 200, 400, 800))):
+        if allowed >= width:
+            return allowed
+    return None
+
+
+def choose_format(source_format: Optional[str], fmt: Optional[str]) -> str:
+    """ Choose the format of a derivative.
+
+    Args:
+        source_format (str): The Pillow format of the original image.
+        fmt (str): The requested format, one of `DERIVATIVE_FORMATS`, None to keep the kind of the original.
+
+    Returns:
+        str: The derivative format, one of `DERIVATIVE_FORMATS`.
+    """
+    if fmt == 'webp' and not is_webp_supported():
+        fmt = None
+    if fmt in DERIVATIVE_FORMATS:
+        return fmt
+    return 'jpeg' if source_format == 'JPEG' else 'png'
+
+
+def is_webp_supported() -> bool:
+    """ Check if Pillow is installed and can write WebP images.
+
+    Returns:
+        bool: True if WebP derivatives can be created.
+    """
+    try:
+        from PIL import features
+    except ImportError:
+        return False
+    return bool(features.check('webp'))
+
+
+def get_derivative(source: str, width: int, fmt: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """ Get a resized derivative of an image, create it if it is not cached yet.
+
+    Args:
+        source (str): The absolute path of the original image.
+        width (int): The width of the derivative in pixels.
+        fmt (str): The requested format, one of `DERIVATIVE_FORMATS`, None to keep the kind of the original.
+
+    Returns:
+        tuple: The path of the derivative relative to the cache directory and its format,
+            None if the original should be served instead.
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+
+    try:
+        stat = os.stat(source)
+    except OSError:
+        return None
+
+    # The modification time is part of the key, a changed original gets a new derivative
+    key = hashlib.sha1(
+        f"{source}:{stat.st_mtime_ns}:{stat.st_size}:{width}:{fmt}".encode()
+    ).hexdigest()
+    cache_dir = get_cache_dir()
+
+    for cached_format in DERIVATIVE_FORMATS:
+        relative = os.path.join(key[:2], f"{key}.{cached_format}")
+        path = os.path.join(cache_dir, relative)
+        try:
+            # Mark the use in the access time, the modification time stays the base of the ETag
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except FileNotFoundError:
+            # not cached, or removed by a concurrent prune of the cache, the derivative is created again
+            continue
+        return relative, cached_format
+
+    try:
+        with Image.open(source) as image:
+            if image.width <= width:
+                return None
+            fmt = choose_format(image.format, fmt)
+            image = ImageOps.exif_transpose(image)
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+            if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                image = image.convert('RGBA')
+
+            relative = os.path.join(key[:2], f"{key}.{fmt}")
+            path = os.path.join(cache_dir, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.{threading.get_ident()}.tmp"
+            image.save(temporary, DERIVATIVE_FORMATS[fmt], quality=82)
+            os.replace(temporary, path)
+    except OSError:
+        # Not an image Pillow can read or the derivative could not be written
+        return None
+
+    _add_to_cache_size(os.path.getsize(path))
+    return relative, fmt
+
+
+def _add_to_cache_size(size: int) -> None:
+    """ Add a new derivative to the estimated cache size and prune the cache once it is too large. """
+    global _cache_bytes
+    max_bytes = current_app.config.get('IMAGE_DERIVATIVE_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+    with _prune_lock:
+        if _cache_bytes is not None:
+            _cache_bytes += size
+            if _cache_bytes <= max_bytes:
+                return
+    prune_cache(max_bytes)
+
+
+def prune_cache(max_bytes: int) -> int:
+    """ Remove the least recently used derivatives until the cache is below its size limit.
+    The cache is reduced to 90 % of the limit, so not every new derivative triggers a removal.
+    The last use of a derivative is its access time.
+
+    Args:
+        max_bytes (int): The maximum size of the cache in bytes.
+
+    Returns:
+        int: The number of removed derivatives.
+    """
+    global _cache_bytes
+    cache_dir = get_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return 0
+
+    with _prune_lock:
+        entries = []
+        total = 0
+        for shard in os.scandir(cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_atime, stat.st_size, entry.path))
+                    total += stat.st_size
+        _cache_bytes = total
+        if total <= max_bytes:
+            return 0
+
+        removed = 0
+        target = max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        _cache_bytes = total
+        return removed
@@ -0,0 +1,236 @@
+""" Shared ingestion of uploaded images.
+    Every upload is streamed in chunks to a temporary file next to its destination and hashed on the way.
+    The content is checked by its magic bytes, not by the name the client sent, and the sizes are limited
+    per file and per request. Finished files are renamed into place atomically, so a reader never sees a partial image.
+    The images are stored by the hash of their content, an image uploaded again references the stored file.
+    Several files of one request are processed in a thread pool.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional
+from flask import current_app, request, has_request_context
+from flask_babel import lazy_gettext as _l
+from werkzeug.datastructures import FileStorage
+from app.utils.image import get_blob_name
+
+
+CHUNK_SIZE = 64 * 1024
+
+# Magic bytes of the accepted image types and the extension of the stored file
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+
+# Prefix of the temporary files, they are never served
+TEMPORARY_PREFIX = '.upload-'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class IngestedImage:
+    """ An uploaded image, stored under its final name.
+
+    Attributes:
+        filename (str): The name of the stored file, relative to the image directory.
+        digest (str): The SHA-256 hex digest of the content.
+        size (int): The size of the file in bytes.
+        created (bool): False if the same content was stored before.
+    """
+
+    __slots__ = ('filename', 'digest', 'size', 'created')
+
+    def __init__(self, filename: str, digest: str, size: int, created: bool = True):
+        self.filename = filename
+        self.digest = digest
+        self.size = size
+        self.created = created
+
+    def __repr__(self):
+        return f"<IngestedImage {self.filename} ({self.size} bytes)>"
+
+
+class _ByteBudget:
+    """ The remaining bytes of all uploads of one request, shared by the worker threads. """
+
+    def __init__(self, limit: int):
+        self.remaining = limit
+        self.lock = threading.Lock()
+
+    def consume(self, size: int) -> bool:
+        """ Take bytes from the budget, False if the budget is exceeded. """
+        with self.lock:
+            self.remaining -= size
+            return self.remaining >= 0
+
+
+def detect_image_extension(head: bytes) -> Optional[str]:
+    """ Detect the type of an image by its first bytes.
+
+    Args:
+        head (bytes): The first bytes of the file.
+
+    Returns:
+        str: The file extension of the image type, None if it is no accepted image.
+    """
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+def get_image_directory(kind: str) -> str:
+    """ Get the directory of the images of a kind.
+
+    Args:
+        kind (str): The image kind, one of item, user or storage.
+
+    Returns:
+        str: The path of the image directory.
+    """
+    return os.path.join('img', kind)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """ Get the thread pool of the uploads, create it on first use. """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('IMAGE_UPLOAD_WORKERS', 4),
+                thread_name_prefix='upload'
+            )
+        return _executor
+
+
+def _ingest_file(upload: FileStorage, directory: str, max_file_bytes: int, budget: _ByteBudget) -> IngestedImage:
+    """ Stream one upload into the directory.
+    The messages are translated lazily, the worker threads have no request context.
+
+    Raises:
+        ValueError: If the upload is too large or no accepted image.
+    """
+    fd, temporary = tempfile.mkstemp(prefix=TEMPORARY_PREFIX, dir=directory)
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+        with os.fdopen(fd, 'wb') as output:
+            while True:
+                chunk = upload.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_file_bytes:
+                    raise ValueError(_l('The image %(name)s is too large.', name=upload.filename))
+                if not budget.consume(len(chunk)):
+                    raise ValueError(_l('The uploaded images are too large in total.'))
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                digest.update(chunk)
+                output.write(chunk)
+
+        extension = detect_image_extension(head)
+        if extension is None:
+            raise ValueError(_l('The file %(name)s is not a JPEG, PNG or GIF image.', name=upload.filename))
+
+        filename = get_blob_name(digest.hexdigest(), extension)
+        path = os.path.join(directory, *filename.split('/'))
+        try:
+            # the file is stored already, it counts as new again until the reference of this upload is committed,
+            # so neither the garbage collector nor `release_images` removes it in the meantime
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temporary, path)
+            return IngestedImage(filename, digest.hexdigest(), size)
+        os.remove(temporary)
+        return IngestedImage(filename, digest.hexdigest(), size, created=False)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def ingest_images(uploads: Iterable[Optional[FileStorage]], kind: str) -> List[IngestedImage]:
+    """ Store uploaded images in the directory of their kind.
+    Empty file fields are skipped and a file uploaded twice in one request is stored once.
+    If one upload fails, no file of the request is kept.
+
+    Args:
+        uploads (Iterable[FileStorage]): The uploaded files, e.g. `request.files.getlist('images')`.
+        kind (str): The image kind, one of item, user or storage.
+
+    Raises:
+        ValueError: If an upload is too large or no accepted image, with a message for the user.
+
+    Returns:
+        list: The stored images, in the order of the uploads.
+    """
+    uploads = [upload for upload in uploads if upload and upload.filename]
+    if not uploads:
+        return []
+
+    max_file_bytes = current_app.config.get('IMAGE_UPLOAD_MAX_FILE_BYTES', 16 * 1024 * 1024)
+    max_request_bytes = current_app.config.get('IMAGE_UPLOAD_MAX_REQUEST_BYTES', 128 * 1024 * 1024)
+    if has_request_context() and (request.content_length or 0) > max_request_bytes:
+        raise ValueError(_l('The uploaded images are too large in total.'))
+
+    directory = get_image_directory(kind)
+    os.makedirs(directory, exist_ok=True)
+    budget = _ByteBudget(max_request_bytes)
+
+    if len(uploads) == 1:
+        results = [_ingest_file(uploads[0], directory, max_file_bytes, budget)]
+    else:
+        executor = _get_executor()
+        futures = [
+            executor.submit(_ingest_file, upload, directory, max_file_bytes, budget)
+            for upload in uploads
+        ]
+        results = []
+        error = None
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as exception:
+                error = error or exception
+        if error is not None:
+            remove_images(results, kind)
+            raise error
+
+    images = []
+    digests = set()
+    for image in results:
+        if image.digest not in digests:
+            digests.add(image.digest)
+            images.append(image)
+    return images
+
+
+def remove_images(images: Iterable[IngestedImage], kind: str) -> None:
+    """ Remove stored images, e.g. if the database changes that reference them fail.
+    Only files created by the upload are removed, an existing file may be referenced by other rows.
+
+    Args:
+        images (Iterable[IngestedImage]): The stored images.
+        kind (str): The image kind, one of item, user or storage.
+
+    Returns:
+        None
+    """
+    directory = get_image_directory(kind)
+    for image in images:
+        if not image.created:
+            continue
+        try:
+            os.remove(os.path.join(directory, *image.filename.split('/')))
+        except FileNotFoundError:
+            pass
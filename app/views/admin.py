@@ -8,7 +8,8 @@ from app.forms import GroupCreateForm, GroupUpdateForm, GroupMembershipForm, \
                     GroupAssignRoleForm, build_role_permission_form, RoleCreateForm, \
                     RoleUpdateForm
 from app.resource.auth.model import Role, Group, Permission
-from app.utils.decorators import check_permissions
+from app.resource.auth.permission import invalidate_permissions
+from app.utils.decorators import check_permissions, primary_db
 
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin', template_folder='templates/admin')
@@ -181,6 +182,7 @@ def update_role(role_id):
 
 
 @admin_bp.route('/roles/<int:role_id>/delete', methods=['GET'])
+@primary_db
 @login_required
 @check_permissions([
                 'admin.backend.access',
@@ -197,6 +199,7 @@ def delete_role(role_id: int):
     """
     role = Role.query.get_or_404(role_id)
     db.session.delete(role)
+    invalidate_permissions()
     db.session.commit()
     return redirect(url_for('admin.roles_view'))
 
@@ -292,6 +295,7 @@ def group_view(group_id):
 
 
 @admin_bp.route('/groups/<int:group_id>/delete', methods=['GET'])
+@primary_db
 @login_required
 @check_permissions([
                 'admin.backend.access',
@@ -308,6 +312,7 @@ def delete_group(group_id: int):
     """
     group = Group.query.get_or_404(group_id)
     db.session.delete(group)
+    invalidate_permissions()
     db.session.commit()
     return redirect(url_for('admin.groups_view'))
 
@@ -334,6 +339,7 @@ def assign_role_to_group(group_id: int):
 
 
 @admin_bp.route('/groups/<int:group_id>/remove_role/<int:role_id>', methods=['GET'])
+@primary_db
 @login_required
 @check_permissions([
                 'admin.backend.access',
@@ -380,11 +386,13 @@ def add_user_to_group(group_id: int):
         group = Group.query.get_or_404(group_id)
         group.users.append(user)
         db.session.add(group)
+        invalidate_permissions()
         db.session.commit()
     return redirect(url_for('admin.group_view', group_id=group_id))
 
 
 @admin_bp.route('/groups/<int:group_id>/remove_user/<int:user_id>', methods=['GET'])
+@primary_db
 @login_required
 @check_permissions([
                 'admin.backend.access',
@@ -404,6 +412,7 @@ def remove_user_from_group(group_id: int, user_id: int):
     user = User.query.get_or_404(user_id)
     if user in group.users:
         group.users.remove(user)
+        invalidate_permissions()
         db.session.commit()
     return redirect(url_for('admin.group_view', group_id=group.id))
 
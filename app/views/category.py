@@ -8,7 +8,8 @@ from flask_login import login_required, current_user
 from app import db
 from app.forms import CategoryCreateForm, CategoryUpdateForm
 from app.resource.category.model import Category, CategoryColor
-from app.utils.decorators import check_permissions
+from app.resource.item.model import get_current_stocks
+from app.utils.decorators import check_permissions, primary_db
 
 
 category_bp = Blueprint('category', __name__)
@@ -75,6 +76,7 @@ def category_view(category_id):
     return render_template('site.category.html',
                             current_user=current_user,
                             category=category,
+                            current_stocks=get_current_stocks(item.id for item in category.items),
                             form_category_update=form_category_update
                         )
 
@@ -105,6 +107,7 @@ def update_category(category_id):
 
 
 @category_bp.route('/categories/<int:category_id>/delete', methods=['GET'])
+@primary_db
 @login_required
 @check_permissions(['category.delete'])
 def delete_category(category_id):
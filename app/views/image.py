@@ -1,21 +1,81 @@
 """ This module handles the image routes of the application.
 It provides functionality to serve images for items, current users, and others images.
 It also includes checks to ensure that the current user is logged in before accessing these routes.
+Uploaded images are cached by browsers and proxies for a long time, the default images are revalidated by their ETag.
 """
 
 import os
 from flask import Blueprint, send_from_directory
-from flask import redirect
+from flask import redirect, url_for, current_app, request, abort
+from werkzeug.security import safe_join
 from flask_login import login_required, current_user
 from app import db
 from app.user.model import User
-from app.utils.image import is_image_name_valid, get_default_user_image
+from app.utils.image import is_image_name_valid, get_default_user_image, is_immutable_image_name
+from app.utils.thumbnail import get_resize_width, get_derivative, get_cache_dir, DERIVATIVE_FORMATS
 
 
 
 image_bp = Blueprint('image', __name__)
 
 
+def accepts_webp():
+    """Check if the client explicitly accepts WebP images, a wildcard is not enough.
+
+    Returns:
+        bool: True if the Accept header of the request lists image/webp.
+    """
+    return any(mimetype == 'image/webp' and quality > 0 for mimetype, quality in request.accept_mimetypes)
+
+
+def send_image(kind, filename):
+    """Send an image file with the caching policy of the application.
+    Uploaded images never change and are marked as immutable, default images get a short max-age.
+    Conditional requests are answered with 304 Not Modified by their ETag or Last-Modified date.
+    The query parameter `w` requests a resized derivative of at least this width, `fmt` its format.
+    Without `fmt` the derivative is WebP if the client accepts it.
+
+    Args:
+        kind (str): The image directory, one of item, user or storage.
+        filename (str): The name of the image file to serve.
+
+    Returns:
+        Response: The image file served from the directory of the kind.
+    """
+    image_dir = os.path.join(os.getcwd(), 'img', kind)
+    immutable = is_immutable_image_name(filename)
+    if immutable:
+        max_age = current_app.config.get('IMAGE_CACHE_MAX_AGE', 31536000)
+    else:
+        max_age = current_app.config.get('IMAGE_DEFAULT_CACHE_MAX_AGE', 300)
+
+    width = get_resize_width(request.args.get('w', type=int))
+    negotiated = False
+    derivative = None
+    if width is not None:
+        source = safe_join(image_dir, filename)
+        if source is None or not os.path.isfile(source):
+            abort(404)
+        fmt = request.args.get('fmt')
+        if fmt not in DERIVATIVE_FORMATS:
+            negotiated = True
+            fmt = 'webp' if accepts_webp() else None
+        derivative = get_derivative(source, width, fmt)
+
+    if derivative is not None:
+        response = send_from_directory(get_cache_dir(), derivative[0], max_age=max_age, conditional=True, etag=True)
+    else:
+        response = send_from_directory(image_dir, filename, max_age=max_age, conditional=True, etag=True)
+    if negotiated:
+        response.vary.add('Accept')
+    if max_age > 0:
+        response.cache_control.immutable = immutable
+        if not current_app.config.get('IMAGE_CACHE_PUBLIC', True):
+            response.cache_control.public = False
+            response.cache_control.private = True
+    return response
+
+
 @image_bp.route('/img/item/<path:filename>')
 @login_required
 def serve_item_image(filename):
@@ -27,22 +87,28 @@ def serve_item_image(filename):
     Returns:
         Response: The image file served from the specified directory.
     """
-    image_dir = os.path.join(os.getcwd(), 'img', 'item')
-    return send_from_directory(image_dir, filename)
+    return send_image('item', filename)
 
 
 @image_bp.route('/img/current_user', methods=['GET'])
 @login_required
 def serve_current_user_image():
     """Serve the current user's image.
+    The redirect depends on the logged in user, so only the browser may cache it.
+    The navigation bar adds the image name to the URL, a new image gets a new URL.
     
     Returns:
         Redirect: Redirects to the user's image URL.
     """
     user = db.session.query(User).filter_by(id=current_user.id).first_or_404()
-    if not is_image_name_valid(user.image_filename):
-        user.image_filename = get_default_user_image()
-    return redirect(f'/img/user/{user.image_filename}')
+    filename = user.image_filename
+    if not is_image_name_valid(filename):
+        filename = get_default_user_image()
+    response = redirect(url_for('image.serve_user_image', filename=filename))
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config.get('IMAGE_REDIRECT_MAX_AGE', 60)
+    response.vary.add('Cookie')
+    return response
 
 
 @image_bp.route('/img/user/<path:filename>')
@@ -56,8 +122,7 @@ def serve_user_image(filename):
     Returns:
         Response: The image file served from the specified directory.
     """
-    image_dir = os.path.join(os.getcwd(), 'img', 'user')
-    return send_from_directory(image_dir, filename)
+    return send_image('user', filename)
 
 
 @image_bp.route('/img/storage/<path:filename>')
@@ -71,5 +136,4 @@ def serve_storage_image(filename):
     Returns:
         Response: The image file served from the specified directory.
     """
-    image_dir = os.path.join(os.getcwd(), 'img', 'storage')
-    return send_from_directory(image_dir, filename)
+    return send_image('storage', filename)
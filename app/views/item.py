@@ -2,24 +2,35 @@
 It provides routes for displaying items, creating new items, and managing item images.
 """
 
-import os
-from uuid import uuid4
+from datetime import datetime, timezone
+from typing import Optional
 from flask import Blueprint, render_template, url_for
-from flask import request, redirect
+from flask import request, redirect, flash, current_app, Response, stream_with_context
 from flask_babel import gettext as _
 from flask_login import login_required, current_user
 from app import db
-from app.forms import build_item_form
+from app.forms import build_item_form, ItemImportForm
 from app.resource.category.model import Category
-from app.resource.item.model import Item, ItemImage, ItemStorageStock
-from app.resource.storage_location.storage import get_storage_hierarchy_ids, get_storage_hierarchy
+from app.resource.item.history import get_stock_history
+from app.resource.item.exporter import iter_export, EXPORT_FORMATS, EXPORT_MIMETYPES
+from app.resource.item.importer import import_items, detect_import_format, IMPORT_FORMATS
+from app.resource.item.model import Item, ItemImage, ItemStorageStock, ItemStorageStockArchive
+from app.resource.storage_location.storage import get_storage_ancestors
 from app.user.model import User
-from app.utils.decorators import check_permissions
+from app.utils.decorators import check_permissions, primary_db
+from app.utils.image_store import release_images
+from app.utils.upload import ingest_images
 
 
 item_bp = Blueprint('item', __name__)
 
 
+def _get_storage_location_id(value) -> Optional[int]:
+    """ Convert the storage location of the item form, the hidden input posts '' for no storage location. """
+    value = str(value or '').strip()
+    return int(value) if value.isdigit() else None
+
+
 @item_bp.route('/items/<int:item_id>', methods=['GET'])
 @login_required
 @check_permissions(['items.read'])
@@ -44,19 +55,17 @@ def item_view(item_id):
         2. The value is a dictionary containing:
         - 'title': The title of the chart.
         - 'description': A description of the chart.
-        - 'labels': A list of labels for the chart.
-        - 'data': A list of data points for the chart.
+        - 'url': The URL of the JSON endpoint with the labels and data points of the chart.
         - 'name': The name of the chart.
 
         If required, you can add more charts by following the same structure.
-        The data can be used to render charts using a JavaScript charting library like Chart.js.
+        The data is loaded when the chart becomes visible and rendered using a JavaScript charting library like Chart.js.
 
         Example:
             {'overall_sum': {
                 'title': 'Title of the chart',
                 'description': 'Description of the chart',
-                'labels': ['Label1', 'Label2', 'Label3'],
-                'data': [12, 19, 3],
+                'url': '/api/...',
                 'name': 'name of the chart'
             }
     """
@@ -65,8 +74,7 @@ def item_view(item_id):
         "quantity_over_time": {
             "title": _("Quantity Over Time"),
             "description": _("This chart shows the quantity of the item over time."),
-            "labels": [ stock.format_timestamp() for stock in item.stocks],
-            "data": [ stock.quantity for stock in item.stocks ],
+            "url": url_for('item.api_get_stock_history', item_id=item.id),
             "name": 'quantity_over_time'
         }
     }
@@ -87,6 +95,7 @@ def item_view(item_id):
 
     # storage_hierarchy requiered for for the breadcrumbs in the item view
     # storage_hierarchy_ids requiered for the select field in the item update form
+    storage_hierarchy, storage_hierarchy_ids = get_storage_ancestors(item.storage_location_id)
     return render_template('site.item.html',
                            current_user=current_user,
                            item=item,
@@ -96,12 +105,13 @@ def item_view(item_id):
                            form_item_quantity=form_item_quantity,
                            categories=categories,
                            getattr=getattr,
-                           storage_hierarchy=get_storage_hierarchy(item.storage_location_id),
-                           storage_hierarchy_ids=get_storage_hierarchy_ids(item.storage_location_id)
+                           storage_hierarchy=storage_hierarchy,
+                           storage_hierarchy_ids=storage_hierarchy_ids
                            )
 
 
 @item_bp.route('/items/<int:item_id>/delete', methods=['GET'])
+@primary_db
 @login_required
 @check_permissions(['item.delete'])
 def delete_item(item_id):
@@ -116,13 +126,13 @@ def delete_item(item_id):
     item = db.session.query(Item).filter_by(id=item_id).first_or_404()
     images = db.session.query(ItemImage).filter_by(item_id=item_id).all()
     db.session.query(ItemStorageStock).filter_by(item_id=item_id).delete()
+    db.session.query(ItemStorageStockArchive).filter_by(item_id=item_id).delete()
     for image in images:
-        image_path = os.path.join('img', 'item', image.filename)
-        if os.path.exists(image_path):
-            os.remove(image_path)
         db.session.delete(image)
     db.session.delete(item)
     db.session.commit()
+    # other items may show the same image files
+    release_images('item', [image.filename for image in images])
     return redirect( url_for('main.catalog') )
 
 
@@ -151,9 +161,15 @@ def update_item_post(item_id):
     form.process(request.form)
 
     if form.validate_on_submit():
+        try:
+            images = ingest_images(request.files.getlist('images'), 'item')
+        except ValueError as error:
+            flash(str(error))
+            return redirect( url_for('item.item_view', item_id=item_id) )
+
         item.name = form.name.data
         item.description = form.description.data if form.description.data != '' else None
-        item.storage_location_id = form.storage_location.data
+        item.storage_location_id = _get_storage_location_id(form.storage_location.data)
         item.owner_id = form.owner.data if form.owner.data > 0 else None
 
         # Update categories
@@ -162,15 +178,8 @@ def update_item_post(item_id):
             if f'category_{category.id}' in request.form:
                 item.categories.append(category)
 
-        # Handle image uploads
-        form.images.data = request.files.getlist('images')
-        if form.images.data:
-            for image in form.images.data:
-                if image and image.filename:
-                    ext = image.filename[image.filename.rfind('.'):]
-                    unique_name = f"{uuid4()}{ext}"
-                    image.save(os.path.join('img', 'item', unique_name))
-                    db.session.add(ItemImage(item_id=item_id, filename=unique_name))
+        for image in images:
+            db.session.add(ItemImage(item_id=item_id, filename=image.filename))
 
         if item.get_current_stock() != form.quantity.data:
             # Update stock quantity
@@ -244,12 +253,17 @@ def create_item():
     )
 
     if form.validate_on_submit():
-        owner_id = request.form.get('owner')
+        try:
+            images = ingest_images(request.files.getlist('images'), 'item')
+        except ValueError as error:
+            flash(str(error))
+            return redirect(url_for('main.catalog'))
+
         item = Item(
             name=form.name.data,
             description=form.description.data if form.description.data != '' else None,
-            storage_location_id=form.storage_location.data,
-            owner_id=owner_id if owner_id != '0' else None
+            storage_location_id=_get_storage_location_id(form.storage_location.data),
+            owner_id=form.owner.data if form.owner.data else None
         )
 
         quantity = ItemStorageStock(
@@ -269,13 +283,109 @@ def create_item():
         db.session.add(item)
         db.session.commit()
 
-        form.images.data = request.files.getlist('images')
-        if form.images.data:
-            for image in form.images.data:
-                if image and image.filename:
-                    ext = image.filename[image.filename.rfind('.'):]
-                    unique_name = f"{uuid4()}{ext}"
-                    image.save(os.path.join('img', 'item', unique_name))
-                    db.session.add(ItemImage(item_id=item.id, filename=unique_name))
+        if images:
+            for image in images:
+                db.session.add(ItemImage(item_id=item.id, filename=image.filename))
             db.session.commit()
     return redirect(url_for('main.catalog'))
+
+
+@item_bp.route('/items/import', methods=['POST'])
+@login_required
+@check_permissions(['item.create'])
+def import_items_post():
+    """ Handle the bulk import of items from a CSV or JSON Lines file.
+    The rows with errors are skipped and reported, all other rows are imported.
+    Clients which accept JSON get the full report, the form gets a summary as flash messages.
+
+    Returns:
+        The import report as JSON or a redirect to the catalog page.
+    """
+    form = ItemImportForm()
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    if not form.validate_on_submit():
+        if wants_json:
+            return {'errors': form.errors}, 400
+        flash(_('Please select a CSV or JSON Lines file to import.'))
+        return redirect(url_for('main.catalog'))
+
+    upload = form.file.data
+
+    fmt = request.form.get('format')
+    if fmt not in IMPORT_FORMATS:
+        fmt = detect_import_format(upload.filename)
+    result = import_items(upload.stream, fmt, batch_size=current_app.config.get('ITEM_IMPORT_BATCH_SIZE', 1000))
+
+    if wants_json:
+        return result.to_dict(), 200
+    flash(_('%(created)s items imported.', created=result.created), 'success')
+    if result.failed:
+        flash(_('%(failed)s rows were skipped:', failed=result.failed))
+        for line, message in result.errors[:10]:
+            flash(_('Line %(line)s: %(message)s', line=line, message=message))
+    return redirect(url_for('main.catalog'))
+
+
+@item_bp.route('/items/export', methods=['GET'])
+@login_required
+@check_permissions(['items.read'])
+def export_items():
+    """ Stream all items as CSV or JSON Lines, the format is set with the query parameter `format`.
+    The rows are written while they are read, the response is never built in memory.
+
+    Returns:
+        The streamed export as a file download.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'csv'
+    chunks = iter_export(fmt, batch_size=current_app.config.get('ITEM_EXPORT_BATCH_SIZE', 1000))
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename=items.{fmt}'}
+    )
+
+
+def _parse_timestamp(value: str):
+    """ Parse an ISO timestamp of a query parameter into a naive UTC timestamp, None if it is empty.
+
+    Raises:
+        ValueError: If the value is no ISO timestamp.
+    """
+    if not value:
+        return None
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+@item_bp.route('/api/items/<int:item_id>/stock_history', methods=['GET'])
+@login_required
+@check_permissions(['items.read'])
+def api_get_stock_history(item_id: int):
+    """ Get the quantity of an item over time for a chart.
+    The range is set with the ISO timestamps `start` and `end`, the number of points with `points`,
+    which is limited by `ITEM_HISTORY_MAX_POINTS`. Long histories are downsampled.
+
+    Args:
+        item_id (int): The ID of the item.
+
+    Returns:
+        JSON with the labels and the data points of the chart.
+    """
+    Item.query.get_or_404(item_id)
+    try:
+        start = _parse_timestamp(request.args.get('start'))
+        end = _parse_timestamp(request.args.get('end'))
+    except ValueError:
+        return {'error': 'start and end must be ISO timestamps'}, 400
+    max_points = current_app.config.get('ITEM_HISTORY_MAX_POINTS', 500)
+    points = max(2, min(request.args.get('points', max_points, type=int), max_points))
+
+    history = get_stock_history(item_id, start, end, points)
+    return {
+        'labels': [timestamp.strftime('%Y-%m-%d %H:%M:%S') for timestamp, _quantity in history],
+        'data': [quantity for _timestamp, quantity in history],
+    }
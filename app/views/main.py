@@ -1,14 +1,18 @@
 """ This module handles the main views of the application, including the index, dashboard, and error pages."""
 
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, current_app
 from flask_login import login_required, current_user
 from flask_babel import gettext as _
 from app import db
-from app.forms import ItemCreateForm, SearchForm, build_item_form
+from app.forms import ItemCreateForm, ItemImportForm, SearchForm, build_item_form
 from app.resource.category.model import Category
-from app.resource.item.model import Item
-from app.resource.storage_location.model import StorageLocation
+from app.resource.dashboard.statistics import get_dashboard_statistics
+from app.resource.item.catalog import get_catalog_page, CATALOG_SORTS
+from app.resource.item.model import get_current_stocks
+from app.resource.search.index import search_items, search_storages, get_search_limit
+from app.resource.storage_location.tree import get_storage_tree
 from app.user.model import User
+from app.utils.loading import get_loader_options
 
 
 
@@ -44,9 +48,7 @@ def dashboard():
     Returns:
         Rendered template for the dashboard page.
     """
-    users_count = db.session.query(User).count()
-    locations_count = db.session.query(StorageLocation).count()
-    items_count = db.session.query(Item).count()
+    statistics = get_dashboard_statistics()
     """ Prepare data for the dashboard.
 
         The data is structured as follows:
@@ -57,8 +59,10 @@ def dashboard():
         - 'labels': A list of labels for the chart.
         - 'data': A list of data points for the chart.
         - 'name': The name of the chart.
+        - 'type': The Chart.js type of the chart, e.g. 'bar' or 'line'.
 
         If required, you can add more charts by following the same structure.
+        The values are computed in `app.resource.dashboard.statistics` and cached there.
         The data can be used to render charts using a JavaScript charting library like Chart.js.
 
         Example:
@@ -67,7 +71,8 @@ def dashboard():
                 'description': 'Description of the chart',
                 'labels': ['Label1', 'Label2', 'Label3'],
                 'data': [12, 19, 3],
-                'name': 'name of the chart'
+                'name': 'name of the chart',
+                'type': 'bar'
             }
     """
 
@@ -76,8 +81,34 @@ def dashboard():
             "title": _("Overall Summary"),
             "description": _("This is the overall summary of your storage system."),
             "labels": [_("Users"), _("Locations"), _("Items")],
-            "data": [users_count, locations_count, items_count],
-            "name": 'overall_sum'
+            "data": statistics['overall_sum']['data'],
+            "name": 'overall_sum',
+            "type": 'bar'
+        },
+        "items_per_storage": {
+            "title": _("Items per Storage Location"),
+            "description": _("The number of items in each top-level storage location, including all storage locations inside it."),
+            "labels": [label if label is not None else _("Without Storage Location")
+                       for label in statistics['items_per_storage']['labels']],
+            "data": statistics['items_per_storage']['data'],
+            "name": 'items_per_storage',
+            "type": 'bar'
+        },
+        "quantity_per_category": {
+            "title": _("Quantity per Category"),
+            "description": _("The current quantity of all items of each category."),
+            "labels": statistics['quantity_per_category']['labels'],
+            "data": statistics['quantity_per_category']['data'],
+            "name": 'quantity_per_category',
+            "type": 'bar'
+        },
+        "stock_changes_per_week": {
+            "title": _("Stock Changes per Week"),
+            "description": _("The number of stock changes per week, labeled with the first day of the week."),
+            "labels": statistics['stock_changes_per_week']['labels'],
+            "data": statistics['stock_changes_per_week']['data'],
+            "name": 'stock_changes_per_week',
+            "type": 'line'
         }
     }
     return render_template('site.dashboard.html',
@@ -96,14 +127,16 @@ def search_view():
     """
     form = SearchForm()
     if form.validate_on_submit():
-        items = Item.query.filter(Item.name.ilike(f"%{form.query.data}%")).all()
-        users = User.query.filter(User.username.ilike(f"%{form.query.data}%")).all()
-        storages = StorageLocation.query.filter(StorageLocation.name.ilike(f"%{form.query.data}%")).all()
+        items = search_items(form.query.data, options=get_loader_options('search_items'))
+        users = User.query.filter(User.username.ilike(f"%{form.query.data}%")) \
+                    .order_by(User.username).limit(get_search_limit()).all()
+        storages = search_storages(form.query.data, options=get_loader_options('search_storages'))
         return render_template('site.search.result.html',
                                current_user=current_user,
                                items=items,
                                users=users,
                                storages=storages,
+                               current_stocks=get_current_stocks(item.id for item in items),
                                form=form
                                )
 
@@ -153,13 +186,32 @@ def internal_server_error(e):
 @login_required
 def catalog():
     """ Render the catalog page.
+
+    The catalog is paginated with keyset cursors and can be filtered and sorted
+    with the query parameters `category`, `storage`, `owner`, `sort`, `order` and `cursor`.
     
     Returns:
-        Rendered template for the catalog page with a list of items.
+        Rendered template for the catalog page with one page of items.
     """
-    items = db.session.query(Item).all()
-    users = db.session.query(User).all()
-    categories = db.session.query(Category).all()
+    filters = {
+        'category': request.args.get('category', type=int),
+        'storage': request.args.get('storage', type=int),
+        'owner': request.args.get('owner', type=int),
+        'sort': request.args.get('sort', 'id') if request.args.get('sort') in CATALOG_SORTS else 'id',
+        'order': 'desc' if request.args.get('order') == 'desc' else 'asc',
+    }
+    items, next_cursor = get_catalog_page(
+                        category_id=filters['category'],
+                        storage_id=filters['storage'],
+                        owner_id=filters['owner'],
+                        sort=filters['sort'],
+                        descending=filters['order'] == 'desc',
+                        cursor=request.args.get('cursor'),
+                        limit=current_app.config.get('CATALOG_PAGE_SIZE', 50),
+                        options=get_loader_options('catalog')
+                    )
+    users = db.session.execute(db.select(User.id, User.username).order_by(User.id)).all()
+    categories = db.session.query(Category).options(*get_loader_options('categories')).all()
     
     form = build_item_form(
                         item=None,
@@ -170,6 +222,13 @@ def catalog():
     return render_template('site.catalog.html',
                             current_user=current_user,
                             items=items,
+                            form_import_items=ItemImportForm(),
+                            current_stocks=get_current_stocks(item.id for item in items),
+                            filters={key: value for key, value in filters.items() if value},
+                            next_cursor=next_cursor,
+                            is_first_page=not request.args.get('cursor'),
+                            users=users,
+                            storage_tree=get_storage_tree(),
                             form=form,
                             categories=categories,
                             getattr=getattr,
@@ -2,21 +2,22 @@
 This module provides routes to display storage locations and individual storage details.
 """
 
-import os
 from typing import Dict
-from uuid import uuid4
 from flask import Blueprint, render_template
-from flask import request, redirect, url_for
+from flask import request, redirect, url_for, flash, current_app
 from flask_babel import gettext as _
 from flask_login import login_required, current_user
 from app import db
 from app.forms import StorageCreateForm, StorageUpdateForm
 from app.resource.storage_location.model import StorageLocation, StorageLocationImage, \
                                                 StorageLocationImage
-from app.resource.item.model import ItemStorageStock
-from app.resource.storage_location.storage import get_storage_hierarchy, \
-                                                get_storage_hierarchy_ids
-from app.utils.decorators import check_permissions
+from app.resource.storage_location.storage import get_storage_ancestors, move_storage, \
+                                                count_items_in_subtree, delete_storage_subtree, \
+                                                STORAGE_DELETE_POLICIES
+from app.resource.storage_location.tree import get_storage_tree
+from app.utils.decorators import check_permissions, primary_db
+from app.utils.jobs import start_job, get_job
+from app.utils.upload import ingest_images, remove_images
 
 
 storage_bp = Blueprint('storage', __name__)
@@ -31,11 +32,20 @@ def storages_view():
     Returns:
         Rendered template for the storages page with a list of storage locations.
     """
-    storages = db.session.query(StorageLocation).all()
+    storages = db.session.execute(
+        db.select(
+            StorageLocation.id, StorageLocation.parent_id, StorageLocation.name, StorageLocation.description
+        ).order_by(StorageLocation.id)
+    ).all()
     form = StorageCreateForm()
+    job = get_job(request.args.get('job', ''))
+    if job is not None and job.user_id != current_user.id:
+        job = None
     return render_template('site.storages.html',
                            current_user=current_user,
                            storages=storages,
+                           storage_tree=get_storage_tree(),
+                           job=job,
                            form=form
                            )
 
@@ -52,6 +62,12 @@ def create_storage():
     form = StorageCreateForm(request.form)
     form.images.data = request.files.getlist('images')
     if form.validate_on_submit():
+        try:
+            images = ingest_images(form.images.data, 'storage')
+        except ValueError as error:
+            flash(str(error))
+            return redirect(url_for('storage.storages_view'))
+
         storage = StorageLocation(
             name=form.name.data,
             description=form.description.data if form.description.data else None
@@ -59,13 +75,8 @@ def create_storage():
         db.session.add(storage)
         db.session.merge(storage)
 
-        if form.images.data:
-            for image in form.images.data:
-                if image and image.filename:
-                    ext = image.filename[image.filename.rfind('.'):]
-                    unique_name = f"{uuid4()}{ext}"
-                    image.save(os.path.join('img', 'storage', unique_name))
-                    db.session.add(StorageLocationImage(storage_location_id=storage.id, filename=unique_name))
+        for image in images:
+            db.session.add(StorageLocationImage(storage_location_id=storage.id, filename=image.filename))
         db.session.commit()
         return redirect(url_for('storage.storages_view'))
     else:
@@ -99,13 +110,16 @@ def storage_view(storage_id):
     )
     # storage_hierarchy requiered for for the breadcrumbs in the storage view
     # storage_hierarchy_ids requiered for the select field in the storage update form
+    storage_hierarchy, storage_hierarchy_ids = get_storage_ancestors(storage.id)
     return render_template('site.storage.html',
                            current_user=current_user,
                            storage=storage,
                            qrcode_url=qrcode_url,
                            form=form,
-                           storage_hierarchy=get_storage_hierarchy(storage.id),
-                           storage_hierarchy_ids=get_storage_hierarchy_ids(storage.id)
+                           storage_hierarchy=storage_hierarchy,
+                           storage_hierarchy_ids=storage_hierarchy_ids,
+                           subtree_items_count=count_items_in_subtree(storage),
+                           storage_tree=get_storage_tree()
                            )
 
 
@@ -125,18 +139,34 @@ def update_storage(storage_id):
     form = StorageUpdateForm(request.form)
     form.images.data = request.files.getlist('images')
     if form.validate_on_submit():
+        try:
+            images = ingest_images(form.images.data, 'storage')
+        except ValueError as error:
+            flash(str(error))
+            return redirect( url_for('storage.storage_view', storage_id=storage_id) )
 
         storage.name = form.name.data
         storage.description = form.description.data
         # ! attention: different naming between form and model
-        storage.parent_id = form.storage_location.data if form.storage_location.data != '' else None
-        if form.images.data:
-            for image in form.images.data:
-                if image and image.filename:
-                    ext = image.filename[image.filename.rfind('.'):]
-                    unique_name = f"{uuid4()}{ext}"
-                    image.save(os.path.join('img', 'storage', unique_name))
-                    db.session.add(StorageLocationImage(storage_location_id=storage.id, filename=unique_name))
+        error = None
+        try:
+            parent_id = int(form.storage_location.data) if form.storage_location.data else None
+        except ValueError:
+            error = _('The parent storage location is invalid.')
+        else:
+            if parent_id is not None and db.session.get(StorageLocation, parent_id) is None:
+                error = _('The parent storage location does not exist.')
+            elif parent_id != storage.parent_id:
+                try:
+                    move_storage(storage, parent_id)
+                except ValueError:
+                    error = _('A storage cannot be placed inside itself.')
+        if error:
+            remove_images(images, 'storage')
+            flash(error)
+            return redirect( url_for('storage.storage_view', storage_id=storage_id) )
+        for image in images:
+            db.session.add(StorageLocationImage(storage_location_id=storage.id, filename=image.filename))
 
         db.session.add(storage)
         db.session.commit()
@@ -147,37 +177,61 @@ def update_storage(storage_id):
 
 
 @storage_bp.route('/storages/<int:storage_id>/delete', methods=['GET'])
+@primary_db
 @login_required
 @check_permissions(['storage.delete'])
 def delete_storage(storage_id):
-    """ Delete a storage location.
+    """ Delete a storage location with all storage locations inside it.
+    The deletion runs as a background job, the storages page shows its progress.
+    The query parameter `policy` decides what happens to the contained items, see `STORAGE_DELETE_POLICIES`.
     
     Args:
         storage_id (int): The ID of the storage location to delete.
 
     Returns:
-        Redirects to the storages page after deletion.
+        Redirects to the storages page with the ID of the deletion job.
     """
     storage = db.session.query(StorageLocation).filter_by(id=storage_id).first_or_404()
+    policy = request.args.get('policy', 'rehome')
+    if policy not in STORAGE_DELETE_POLICIES:
+        policy = 'rehome'
+
+    job = start_job('delete_storage', run_delete_storage_job, storage.id, policy,
+                    batch_size=current_app.config.get('STORAGE_DELETE_BATCH_SIZE', 500),
+                    user_id=current_user.id)
+    return redirect( url_for('storage.storages_view', job=job.id) )
+
+
+def run_delete_storage_job(job, storage_id: int, policy: str, batch_size: int) -> Dict:
+    """ Delete a storage location subtree and report the progress to the job.
+
+    Args:
+        job (Job): The job of the deletion.
+        storage_id (int): The ID of the storage location to delete.
+        policy (str): What happens to the contained items.
+        batch_size (int): The maximum number of IDs per statement.
+
+    Returns:
+        Dict: The numbers of deleted storage locations, items and image files.
+    """
+    return delete_storage_subtree(storage_id, policy, batch_size, progress=job.update)
+
+
+@storage_bp.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def api_get_job(job_id) -> Dict:
+    """ Get the progress of a background job of the current user.
     
-    # remove all images associated with the storage location
-    # from the filesystem and database
-    images = db.session.query(StorageLocationImage).filter_by(storage_location_id=storage.id).all()
-    for image in images:
-        image_path = os.path.join('img', 'storage', image.filename)
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        db.session.delete(image)
-
-    # remove all item stocks associated with the storage location
-    item_stocks = db.session.query(ItemStorageStock).filter_by(storage_location_id=storage.id).all()
-    for stock in item_stocks:
-        db.session.delete(stock)
-
-    # remove the storage location itself
-    db.session.delete(storage)
-    db.session.commit()
-    return redirect( url_for('storage.storages_view') )
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        Dict: The state of the job, see `Job.to_dict`.
+    """
+    job = get_job(job_id)
+    if job is None or job.user_id != current_user.id:
+        return {'error': 'not found'}, 404
+    return job.to_dict(), 200
 
 
 @storage_bp.route('/api/storages/list/childs/<int:storage_id>', methods=['GET'])
@@ -191,7 +245,7 @@ def api_get_all_child_storages(storage_id) -> Dict:
     """
     if storage_id == 0:
         storage_id = None
-    storages = db.session.query(StorageLocation).filter_by(parent_id=storage_id).all()
+    storages = get_storage_tree().get_children(storage_id)
     storage_data = []
     for storage in storages:
         storage_data.append(
@@ -212,7 +266,7 @@ def api_get_all_storages() -> Dict:
     Returns:
         Dict: A dictionary containing a list of all storage locations with their IDs and names.
     """
-    storages = db.session.query(StorageLocation).all()
+    storages = get_storage_tree().nodes.values()
     storage_data = []
     for storage in storages:
         storage_data.append(
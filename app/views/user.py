@@ -1,16 +1,17 @@
 """ This module handles the user views of the application."""
 
-import os
-from uuid import uuid4
 from flask import Blueprint, render_template, url_for
 from flask import redirect, flash, request
 from flask_babel import gettext as _, lazy_gettext
 from flask_login import login_required, current_user
 from app import db
 from app.forms import RegistrationForm, UserUpdateForm
+from app.resource.auth.permission import invalidate_permissions
 from app.user.model import User
 from app.utils.image import is_image_name_valid, get_default_user_image
-from app.utils.decorators import check_permissions, check_own_or_has_permissions
+from app.utils.decorators import check_permissions, check_own_or_has_permissions, primary_db
+from app.utils.image_store import release_images
+from app.utils.upload import ingest_images
 
 
 user_bp = Blueprint('user', __name__)
@@ -24,7 +25,9 @@ def users_view():
     Returns:
         Rendered template for the users page with a list of users.
     """
-    users = db.session.query(User).all()
+    users = db.session.execute(
+        db.select(User.id, User.first_name, User.last_name).order_by(User.id)
+    ).all()
     return render_template('site.users.html',
                            current_user=current_user,
                            users=users
@@ -71,6 +74,7 @@ def create_user():
 
 
 @user_bp.route('/users/<int:user_id>/delete', methods=['GET'])
+@primary_db
 @login_required
 @check_own_or_has_permissions([
                 'admin.user.delete'
@@ -88,12 +92,12 @@ def delete_user(user_id):
     delete_current_user = False
     if user.id == current_user.id:
         delete_current_user = True
-    if user.image_filename and user.image_filename != get_default_user_image():
-        image_path = os.path.join('img', 'user', user.image_filename)
-        if os.path.exists(image_path):
-            os.remove(image_path)
+    image_filename = user.image_filename
     db.session.delete(user)
+    # the ID of a deleted user may be reused, so its cached permissions must be dropped
+    invalidate_permissions()
     db.session.commit()
+    release_images('user', [image_filename])
     if delete_current_user:
         redirect(url_for('auth.logout'))
 
@@ -146,28 +150,26 @@ def update_user(user_id):
             flash(_('Old password is incorrect.'))
             return render_template('site.user.update.html', current_user=current_user, user=user, form=form)
 
+        try:
+            images = ingest_images([form.image.data], 'user')
+        except ValueError as error:
+            flash(str(error))
+            return render_template('site.user.update.html', current_user=current_user, user=user, form=form)
+
         form.populate_obj(user)
         # * image handling
         # remove old image if exists
+        old_image_filename = user.image_filename
         if form.delete_image.data or form.image.data:
-            if user.image_filename and user.image_filename != get_default_user_image():
-                old_image_path = os.path.join('img', 'user', user.image_filename)
-                if os.path.exists(old_image_path):
-                    os.remove(old_image_path)
             user.image_filename = None
 
         # save new image
-        if form.image.data:
-            image = form.image.data
-            filename = image.filename
-            ext = os.path.splitext(filename)[1]
-            unique_name = f"{uuid4()}{ext}"
-            image_path = os.path.join('img', 'user', unique_name)
-            # Ensure directory exists
-            image.save(image_path)
-            user.image_filename = unique_name
+        if images:
+            user.image_filename = images[0].filename
         db.session.add(user)
         db.session.commit()
+        if user.image_filename != old_image_filename:
+            release_images('user', [old_image_filename])
         return redirect(f'/users/{user.id}')
 
     if not is_image_name_valid(user.image_filename):
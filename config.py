@@ -10,7 +10,73 @@ class Config:
     """ Configuration class for the Flask application. """
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
-    SQLALCHEMY_BINDS = {}
+    # Read replica for the queries of GET requests, e.g. a SQLite file refreshed with `flask replica snapshot`
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    SQLALCHEMY_BINDS = {'replica': DATABASE_REPLICA_URL} if DATABASE_REPLICA_URL else {}
+    # Seconds a client reads from the primary after a change, should exceed the lag of the replica
+    DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', 60))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Engine profile of the database: auto (by the database URL), sqlite, server or none
+    DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'auto')
+    # SQLite profile: milliseconds to wait for a lock before 'database is locked'
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+    # SQLite profile: durability of commits, NORMAL is safe with write-ahead logging
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    # SQLite profile: page cache per connection in KiB
+    SQLITE_CACHE_SIZE_KIB = int(os.environ.get('SQLITE_CACHE_SIZE_KIB', 65536))
+    # SQLite profile: bytes of the database file which are memory mapped
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    # SQLite profile: enforce foreign keys
+    SQLITE_FOREIGN_KEYS = os.environ.get('SQLITE_FOREIGN_KEYS', 'true').lower() in ('1', 'true', 'yes')
+    # Server profile: number of pooled connections and additional connections under load
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 10))
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 20))
+    # Server profile: seconds to wait for a free connection
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT', 30))
+    # Server profile: seconds after which a connection is replaced, before the server closes it
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800))
     LANGUAGES = ['de', 'en']
     BABEL_DEFAULT_LOCALE = 'en'
+    # Maximum number of search results per kind (items, storages, users)
+    SEARCH_RESULT_LIMIT = int(os.environ.get('SEARCH_RESULT_LIMIT', 50))
+    # Number of items per page of the catalog
+    CATALOG_PAGE_SIZE = int(os.environ.get('CATALOG_PAGE_SIZE', 50))
+    # Maximum age in seconds of the cached dashboard statistics, they are refreshed earlier when the inventory changes
+    DASHBOARD_CACHE_SECONDS = int(os.environ.get('DASHBOARD_CACHE_SECONDS', 300))
+    # Number of weeks shown in the stock changes chart of the dashboard
+    DASHBOARD_WEEKS = int(os.environ.get('DASHBOARD_WEEKS', 12))
+    # Days of stock history kept at full resolution by `flask stock compact`
+    STOCK_HISTORY_RAW_DAYS = int(os.environ.get('STOCK_HISTORY_RAW_DAYS', 90))
+    # Days of stock history with one snapshot per day, older history keeps one snapshot per week
+    STOCK_HISTORY_DAILY_DAYS = int(os.environ.get('STOCK_HISTORY_DAILY_DAYS', 365))
+    # Maximum number of points of the quantity chart of an item, longer histories are downsampled
+    ITEM_HISTORY_MAX_POINTS = int(os.environ.get('ITEM_HISTORY_MAX_POINTS', 500))
+    # Number of items per insert statement and transaction of the bulk import
+    ITEM_IMPORT_BATCH_SIZE = int(os.environ.get('ITEM_IMPORT_BATCH_SIZE', 1000))
+    # Number of items fetched per partition of the streamed export
+    ITEM_EXPORT_BATCH_SIZE = int(os.environ.get('ITEM_EXPORT_BATCH_SIZE', 1000))
+    # Maximum number of IDs per statement when a storage location subtree is deleted
+    STORAGE_DELETE_BATCH_SIZE = int(os.environ.get('STORAGE_DELETE_BATCH_SIZE', 500))
+    # Raise on lazy loads while rendering list templates, None follows the debug mode
+    ASSERT_NO_LAZY_LOADS = None
+    # Seconds browsers and proxies may cache uploaded images, their names never get reused
+    IMAGE_CACHE_MAX_AGE = int(os.environ.get('IMAGE_CACHE_MAX_AGE', 31536000))
+    # Seconds browsers and proxies may cache the default images before revalidating them
+    IMAGE_DEFAULT_CACHE_MAX_AGE = int(os.environ.get('IMAGE_DEFAULT_CACHE_MAX_AGE', 300))
+    # Seconds a browser may cache the redirect to the image of the current user
+    IMAGE_REDIRECT_MAX_AGE = int(os.environ.get('IMAGE_REDIRECT_MAX_AGE', 60))
+    # Allow shared caches (reverse proxies) to store images, otherwise only the browser may cache them
+    IMAGE_CACHE_PUBLIC = os.environ.get('IMAGE_CACHE_PUBLIC', 'true').lower() == 'true'
+    # Widths in pixels of the resized image derivatives, requested widths are rounded up to one of them
+    IMAGE_RESIZE_WIDTHS = (100, 200, 400, 800, 1600)
+    # Maximum size in bytes of the derivative cache in img/cache
+    IMAGE_DERIVATIVE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_DERIVATIVE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    # Maximum size in bytes of one uploaded image and of all images of one request
+    IMAGE_UPLOAD_MAX_FILE_BYTES = int(os.environ.get('IMAGE_UPLOAD_MAX_FILE_BYTES', 16 * 1024 * 1024))
+    IMAGE_UPLOAD_MAX_REQUEST_BYTES = int(os.environ.get('IMAGE_UPLOAD_MAX_REQUEST_BYTES', 128 * 1024 * 1024))
+    # Number of threads storing the images of multi-file uploads
+    IMAGE_UPLOAD_WORKERS = int(os.environ.get('IMAGE_UPLOAD_WORKERS', 4))
+    # Seconds an image file without a row is left alone, its row may not be committed yet
+    IMAGE_GC_MIN_AGE = int(os.environ.get('IMAGE_GC_MIN_AGE', 3600))
+    # Seconds an orphaned image file stays in img/.quarantine before it is deleted
+    IMAGE_QUARANTINE_SECONDS = int(os.environ.get('IMAGE_QUARANTINE_SECONDS', 7 * 24 * 3600))
@@ -2,12 +2,15 @@
     It initializes the app, sets up the database, and runs the server.
 """
 
-from app import create_app, db
+from app import create_app
+from app.resource.search.index import ensure_search_index
+from app.utils.schema import upgrade_schema
 
 app = create_app()
 
 with app.app_context():
-    db.create_all()
+    upgrade_schema()
+    ensure_search_index()
 
 
 if __name__ == '__main__':
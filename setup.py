@@ -1,7 +1,10 @@
 """ This script seeds the database with initial data for permissions, roles, groups, and users. """
 
 from app import create_app, db
+from app.resource.search.index import ensure_search_index
+from app.utils.schema import upgrade_schema
 from app.resource.auth.model import Permission, Role, Group
+from app.resource.auth.permission import invalidate_permissions
 from app.resource.category.model import Category, CategoryColor
 from app.user.model import User
 
@@ -343,11 +346,14 @@ def run_seeding():
     seed_category_colors()
     print("Seeding categories...")
     seed_categories()
+    invalidate_permissions()
+    db.session.commit()
     print("Done.")
 
 
 app = create_app()
 
 with app.app_context():
-    db.create_all()
+    upgrade_schema()
+    ensure_search_index()
     run_seeding()